@@ -1,197 +1,1348 @@
 import os
+import io
+import sys
 import csv
 import re
-import openpyxl
-from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
-from openpyxl.styles import Alignment
-from openpyxl.utils import get_column_letter
-from zipfile import ZipFile
+import time
+import pickle
+import heapq
+import collections
+import itertools
+import bisect
+import struct
+import zlib
+import select
+import signal
+import ctypes
+import ctypes.util
+import mmap
+import hashlib
+import sqlite3
+import json
+import resource
+import importlib
+import tracemalloc
+import argparse
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED, BadZipFile
 from getpass import getpass
+import shutil
+import tempfile
 from shutil import rmtree as dirRemover
-from datetime import date
-from copy import copy
-
-
-def copy_sheet(source_sheet, target_sheet):
-    copy_cells(source_sheet, target_sheet)  # copy all the cel values and styles
-    copy_sheet_attributes(source_sheet, target_sheet)
-
-
-def copy_sheet_attributes(source_sheet, target_sheet):
-    target_sheet.sheet_format = copy(source_sheet.sheet_format)
-    target_sheet.sheet_properties = copy(source_sheet.sheet_properties)
-    target_sheet.merged_cells = copy(source_sheet.merged_cells)
-    target_sheet.page_margins = copy(source_sheet.page_margins)
-    target_sheet.freeze_panes = copy(source_sheet.freeze_panes)
-
-    # set row dimensions
-    # So you cannot copy the row_dimensions attribute. Does not work (because of meta data in the attribute I think). So we copy every row's row_dimensions. That seems to work.
-    for rn in range(len(source_sheet.row_dimensions)):
-        target_sheet.row_dimensions[rn] = copy(source_sheet.row_dimensions[rn])
-
-    if source_sheet.sheet_format.defaultColWidth is None:
-        print('Unable to copy default column wide')
-    else:
-        target_sheet.sheet_format.defaultColWidth = copy(source_sheet.sheet_format.defaultColWidth)
+from datetime import date, datetime
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+
+
+def seq_num_line(data, position):
+    """Start of the first line holding a seqNum at or after position, the
+    end of data if there's none"""
+    found = data.find(b'seqNum', position)
+    return len(data) if found == -1 else data.rfind(b'\n', 0, found) + 1
+
+
+def seq_num_line_after(data, after):
+    """Start of the first seqNum line with a seqNum above after, the end of
+    data if there's none. The firmware writes its logs in seqNum order, so
+    it's found by bisecting the byte offsets of data instead of scanning
+    the messages analyzed before."""
+    def above(position):
+        line = seq_num_line(data, position)
+        if line >= len(data):
+            return True
+        end = data.find(b'\n', line)
+        text = data[line:len(data) if end == -1 else end].decode('utf-8', 'replace')
+        seq_num = to_int(text.partition(':')[2].strip())
+        return seq_num is None or seq_num > after
+
+    low, high = 0, len(data)
+    while low < high:
+        middle = (low + high) // 2
+        if above(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return seq_num_line(data, low)
+
+
+def event_log_records(data, after=None, terms=None):
+    """Yields each seqNum message of an event log as a single line, skipping
+    the messages whose seqNum isn't above after. data is the bytes of the
+    log or an mmap of it, messages are cut at their seqNum lines in bytes
+    and only the ones kept are decoded.
+
+    Each record comes with its keywords, the terms of scan_terms() that
+    occur anywhere in its raw message, or None without terms. They're found
+    with bytes.find over a lowercased block of messages at a time, instead
+    of searching every decoded message for every category.
+
+    With after, the messages up to it are skipped before any scanning.
+    """
+    size = len(data)
+    start = seq_num_line(data, 0) if after is None else seq_num_line_after(data, after)
+    while start < size:
+        # Blocks of whole messages, so no message is cut in two
+        starts = [start]
+        while True:
+            line_end = data.find(b'\n', starts[-1])
+            following = size if line_end == -1 else seq_num_line(data, line_end)
+            if following >= size or following - start >= SCAN_BLOCK_BYTES:
+                break
+            starts.append(following)
+        block = data[start:following]
+        offsets = [position - start for position in starts]
+        offsets.append(len(block))
+
+        keywords = [None] * len(starts) if terms is None else [() for _ in starts]
+        if terms:
+            lowered = block.lower()
+            for term in terms:
+                position = lowered.find(term)
+                while position != -1:
+                    index = bisect.bisect_right(offsets, position) - 1
+                    keywords[index] += (term.decode(),)
+                    # One occurrence per message is enough
+                    position = lowered.find(term, offsets[index + 1])
+
+        for index, (begin, end) in enumerate(zip(offsets, offsets[1:])):
+            message = block[begin:end]
+            if after is not None:
+                line = message.split(b'\n', 1)[0].decode('utf-8', 'replace')
+                seq_num = to_int(line.partition(':')[2].strip())
+                if seq_num is not None and seq_num <= after:
+                    continue
+            record = message.decode('utf-8', 'replace')
+            yield record.replace('\r\n', '\n').replace('\n', '  '), keywords[index]
+        start = following
+
+
+def scan_terms(categories):
+    """The lowercase bytes of categories for event_log_records, or None if
+    one of them can't be told from the raw bytes: a non-ASCII one, or one
+    with double spaces that the line breaks of a record turn into"""
+    terms = [category.lower() for category in categories]
+    if not all(term.isascii() and '  ' not in term for term in terms):
+        return None
+    return tuple(term.encode() for term in terms)
+
+
+def scan_event_log(data, after=None, alilog=None, terms=None):
+    """Yields the Events of the bytes of an event log in file order,
+    optionally writing their records to the alilog file on the way"""
+    with open(alilog, 'w') if alilog else nullcontext() as f_obj:
+        for record, keywords in event_log_records(data, after, terms):
+            if f_obj is not None:
+                f_obj.write('\n' + record)
+            yield Event.from_record(record, keywords)
+
+
+def write_alilog(data, after, alilog):
+    """Writes the records of the bytes of an event log to the alilog file,
+    as scan_event_log does on the way"""
+    with open(alilog, 'w') as f_obj:
+        for record, _ in event_log_records(data, after):
+            f_obj.write('\n' + record)
+
+
+def to_int(value):
+    """int() of a decimal or 0x prefixed firmware value, None if it isn't one"""
+    try:
+        return int(value, 16) if value.lower().startswith('0x') else int(value)
+    except (AttributeError, ValueError):
+        return None
+
+
+def org_key(org_name):
+    """The organization name as chassis are told apart by, case and
+    surrounding spaces aside"""
+    return str(org_name).strip().lower()
+
+
+# Header fields of an event record, each one starts a line of the message
+EVENT_FIELDS_RE = re.compile(
+    r'(?:^|  )(seqNum|Time|Seconds since last reboot|Code|Class|Locale|Event Description):[ \t]*')
+
+
+class Event():
+    """A single incremental log message, parsed once from its record"""
+    __slots__ = ('seq_num', 'time', 'reboot_seconds', 'code', 'event_class',
+                 'locale', 'description', 'data', 'keywords')
+
+    def __init__(self, seq_num=None, time=None, reboot_seconds=None, code=None,
+                 event_class=None, locale=None, description='', data='', keywords=None):
+        self.seq_num = seq_num
+        # RTC timestamp as the firmware prints it, e.g. 'Mon Jan  4 10:22:33 2021'
+        self.time = time
+        self.reboot_seconds = reboot_seconds
+        self.code = code
+        self.event_class = event_class
+        self.locale = locale
+        self.description = description
+        self.data = data
+        # Category terms found in the raw message by event_log_records,
+        # None if it wasn't scanned for them
+        self.keywords = keywords
+
+    @classmethod
+    def from_record(cls, record, keywords=None):
+        """Parses a record made by event_log_records"""
+        head, _, data = record.partition('Event Data:')
+        parts = EVENT_FIELDS_RE.split(head)
+        fields = {key: value.strip() for key, value in zip(parts[1::2], parts[2::2])}
+        return cls(
+            seq_num=to_int(fields.get('seqNum')),
+            time=fields.get('Time') or None,
+            reboot_seconds=to_int(fields.get('Seconds since last reboot')),
+            code=to_int(fields.get('Code')),
+            event_class=to_int(fields.get('Class')),
+            locale=to_int(fields.get('Locale')),
+            description=fields.get('Event Description', ''),
+            data=data.strip(),
+            keywords=keywords,
+        )
+
+    def fields(self):
+        """The message fields of the event, in constructor order"""
+        return (self.seq_num, self.time, self.reboot_seconds, self.code,
+                self.event_class, self.locale, self.description, self.data)
+
+    @property
+    def text(self):
+        """Description and data, the part of the message categories match"""
+        return f'{self.description}  {self.data}'
+
+    def when(self):
+        """The time of the event as the report shows it"""
+        if self.time:
+            return f'Time: {self.time}'
+        return f'Seconds since last reboot: {self.reboot_seconds}'
+
+    def timestamp(self):
+        """The RTC time as a datetime, None if the event has none"""
+        if not self.time:
+            return None
+        try:
+            return datetime.strptime(' '.join(self.time.split()), '%a %b %d %H:%M:%S %Y')
+        except ValueError:
+            return None
+
+    def rows(self):
+        """Report rows of the event, one per timestamp it has"""
+        rows = []
+        if self.reboot_seconds is not None:
+            rows.append([f'Seconds since last reboot: {self.reboot_seconds}',
+                         f'Event Description: {self.description}', f'Event Data: {self.data}'])
+        if self.time:
+            rows.append([f'Time: {self.time}',
+                         f'Event Description: {self.description}', f'Event Data: {self.data}'])
+        return rows
+
+
+def seq_key(event):
+    # Events without a seqNum sort after the rest
+    return (event.seq_num is None, event.seq_num or 0)
+
+
+def parse_event_log(data, after=None, alilog=None, terms=None):
+    """Parses the bytes of an event log into its Events sorted by seqNum,
+    optionally writing its records to the alilog file on the way"""
+    events = list(scan_event_log(data, after, alilog, terms))
+    # Already in order for the firmware's own logs, which makes this linear
+    events.sort(key=seq_key)
+    return events
+
+
+def parse_event_chunk(data, after=None, terms=None):
+    """parse_event_log for worker processes, returns the Events as tuples
+    of their constructor arguments"""
+    return [event.fields() + (event.keywords,) for event in parse_event_log(data, after, None, terms)]
+
+
+def split_log(data, pieces):
+    """Splits the bytes of an event log into about pieces chunks, every
+    chunk but the first starting at a seqNum line"""
+    bounds = [0]
+    step = len(data) // pieces
+    for piece in range(1, pieces):
+        position = data.find(b'\nseqNum', max(bounds[-1], piece * step))
+        if position == -1:
+            break
+        bounds.append(position + 1)
+    bounds.append(len(data))
+    return [data[start:end] for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def merge_events(streams):
+    """k-way merges seqNum sorted lists of Events with a heap, keeping only
+    the first Event of each seqNum"""
+    last = None
+    for event in heapq.merge(*streams, key=seq_key):
+        if event.seq_num is not None and event.seq_num == last:
+            continue
+        last = event.seq_num
+        yield event
+
+
+# Below this many bytes of event logs, spawning parser processes costs
+# more than it saves
+PARALLEL_PARSE_MIN_BYTES = 16 * 1024 * 1024
+# Smallest chunk of an event log handed to a parser process
+PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+# Messages of an event log are scanned for categories about this many bytes at a time
+SCAN_BLOCK_BYTES = 1024 * 1024
+
+
+# Categories to search for in log file:
+# Other Category isn't defined, it collects the events matching none of these
+SEARCH_CATEGORIES = (
+    'Power state change',
+    'Unexpected sense',
+    'medium error',
+    'Uncorrectable',
+    'recovery',
+    'Fatal firmware error',
+    'DEGRADED',
+    'State change on VD',
+    'State change on PD',
+    'Consistency Check st',
+    'Consistency Check done',
+    'abort',
+    'inconsistent',
+    'Battery',
+    'Rebuild complete',
+    'Rebuild failed',
+    'Rebuild automatically started',
+    'Rebuild started',
+    # 'ECC',
+)
+
+# Optional category table next to the script, overrides SEARCH_CATEGORIES,
+# see categories.example.txt; --categories picks another one
+CATEGORIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'categories.txt')
+
+
+def load_categories(config_file=None):
+    """Reads the search categories from config_file, one per line with '#'
+    starting a comment, or returns SEARCH_CATEGORIES if there's no such file.
+    Raises ValueError for a file without any, which would put every event
+    in Other."""
+    if not config_file or not os.path.isfile(config_file):
+        return SEARCH_CATEGORIES
+    categories = []
+    with open(config_file, 'r') as f_obj:
+        for line in f_obj:
+            category = line.split('#', 1)[0].strip()
+            if category and category.lower() not in (c.lower() for c in categories):
+                categories.append(category)
+    if not categories:
+        raise ValueError(f'No categories in {config_file}')
+    return tuple(categories)
+
+
+class Classifier():
+    """Sorts event records into every category they mention in a single pass.
+
+    All categories are compiled into one case insensitive alternation,
+    longest first, inside a lookahead so a match is tried at every position.
+    A category that is a prefix of a longer one matching at the same
+    position is picked up through the `contained` table.
+    """
+    def __init__(self, categories):
+        self.categories = tuple(categories)
+        terms = self.terms = {category.lower(): category for category in self.categories}
+        # {lowercase term: [categories whose term occurs within it]}
+        self.contained = {
+            term: [category for other, category in terms.items() if other in term]
+            for term in terms
+        }
+        alternation = '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        self.pattern = re.compile(f'(?=({alternation}))', re.IGNORECASE)
+
+    def match(self, text):
+        """Returns the set of categories mentioned in text"""
+        matched = set()
+        for found in self.pattern.finditer(text):
+            matched.update(self.contained[found.group(1).lower()])
+        return matched
+
+    def classify(self, events, sink=list, index=None):
+        """Returns {category: [Event]} plus an 'Other' category, an event
+        in several categories is the same object in each of their lists.
+        sink makes the container of each category, anything with append(),
+        and each event is also added to the DriveIndex index if given."""
+        results = {category: sink() for category in self.categories}
+        results['Other'] = sink()
+        self.event_count = 0
+        for event in events:
+            self.event_count += 1
+            if event.keywords is None:
+                matched = self.match(event.text)
+            elif event.keywords:
+                # Only the terms found in the raw message can be in its text
+                text = event.text.lower()
+                matched = {self.terms[term] for term in event.keywords if term in text}
+            else:
+                matched = ()
+            for category in matched:
+                results[category].append(event)
+            if not matched:
+                matched = ('Other',)
+                results['Other'].append(event)
+            if index is not None:
+                index.add(event, matched)
+        return results
+
+
+class SpilledEvents():
+    """List-like category sink for bounded memory runs, that pickles its
+    Events into a temporary file instead of keeping them. It also measures
+    the report column widths of its rows as they come, since a write-only
+    sheet needs them before its first row."""
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+        self.widths = {}
+
+    def append(self, event):
+        pickle.dump(event.fields(), self.file, pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+        for row in event.rows():
+            for column, value in enumerate(row, start=1):
+                value = sheet_cell(value)
+                if value and len(str(value)) > self.widths.get(column, 0):
+                    self.widths[column] = len(str(value))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.file.seek(0)
+        try:
+            while True:
+                try:
+                    fields = pickle.load(self.file)
+                except EOFError:
+                    return
+                yield Event(*fields)
+        finally:
+            self.file.seek(0, os.SEEK_END)
 
-    # set specific column width and hidden property
-    # we cannot copy the entire column_dimensions attribute so we copy selected attributes
-    for key, value in source_sheet.column_dimensions.items():
-        target_sheet.column_dimensions[key].min = copy(source_sheet.column_dimensions[key].min)   # Excel actually groups multiple columns under 1 key. Use the min max attribute to also group the columns in the targetSheet
-        target_sheet.column_dimensions[key].max = copy(source_sheet.column_dimensions[key].max)  # https://stackoverflow.com/questions/36417278/openpyxl-can-not-read-consecutive-hidden-columns discussed the issue. Note that this is also the case for the width, not onl;y the hidden property
-        target_sheet.column_dimensions[key].width = copy(source_sheet.column_dimensions[key].width) # set width for every column
-        target_sheet.column_dimensions[key].hidden = copy(source_sheet.column_dimensions[key].hidden)
+    def __getstate__(self):
+        raise TypeError('Spilled events live in a temporary file and cannot be pickled')
 
 
-def copy_cells(source_sheet, target_sheet):
-    for (row, col), source_cell in source_sheet._cells.items():
-        target_cell = target_sheet.cell(column=col, row=row)
+class Disk():
+    # {pdlist label: pd_parameters key}
+    pd_labels = {
+        'Device Id': 'devID',
+        'Enclosure Device ID': 'EncID',
+        'Slot Number': 'slotNum',
+        'Other Error Count': 'otherError',
+        'Media Error Count': 'mediaError',
+        'Predictive Failure Count': 'predictFail',
+        'Firmware state': 'fwState',
+        'Drive has flagged a S.M.A.R.T alert': 'smartAlert',
+        'Raw Size': 'size',
+        'Inquiry Data': 'inquiry',
+    }
 
-        target_cell._value = source_cell._value
-        target_cell.data_type = source_cell.data_type
+    def __init__(self, pd_slice):
+        self.pd_parameters = {key: '' for key in self.pd_labels.values()}
+        self.pd_slice = pd_slice
+        self.get_pd_params()
 
-        if source_cell.has_style:
-            target_cell.font = copy(source_cell.font)
-            target_cell.border = copy(source_cell.border)
-            target_cell.fill = copy(source_cell.fill)
-            target_cell.number_format = copy(source_cell.number_format)
-            target_cell.protection = copy(source_cell.protection)
-            target_cell.alignment = copy(source_cell.alignment)
+    def get_pd_params(self):
+        for line in self.pd_slice:
+            label, sep, value = line.partition(':')
+            key = self.pd_labels.get(label.strip())
+            if not sep or key is None:
+                continue
+            value = value.strip()
+            if key == 'size':
+                # '558.911 GB [0x45dd2fb0 Sectors]'
+                value = value.split('[', 1)[0].strip()
+            elif key not in ('fwState', 'smartAlert', 'inquiry'):
+                value = to_int(value)
+            self.pd_parameters[key] = value
+
+    def rows(self):
+        """Disk_Error_Count rows of the disk"""
+        pd_params = self.pd_parameters
+        E_S = f"{pd_params['EncID']}/{pd_params['slotNum']}"
+        return (
+            (pd_params['devID'], E_S, 'Other Error Count', pd_params['otherError'],
+             pd_params['fwState'], pd_params['smartAlert'], pd_params['size'], pd_params['inquiry']),
+            (None, None, 'Media Error Count', pd_params['mediaError']),
+            (None, None, 'Predictive Failure Count', pd_params['predictFail'])
+        )
+
+
+def read_pdlist(pdlist):
+    """Yields a Disk for each "Enclosure Device ID" section of pdlist, which
+    is either a file path or an already opened text stream"""
+    if isinstance(pdlist, str):
+        pdlist = open(pdlist, 'r')
+    pd_slice = None
+    with pdlist as f_obj:
+        for line in f_obj:
+            if 'Enclosure Device ID' in line:
+                if pd_slice is not None:
+                    yield Disk(pd_slice)
+                pd_slice = []
+            if pd_slice is not None:
+                pd_slice.append(line)
+    if pd_slice is not None:
+        yield Disk(pd_slice)
 
-        if source_cell.hyperlink:
-            target_cell._hyperlink = copy(source_cell.hyperlink)
 
-        if source_cell.comment:
-            target_cell.comment = copy(source_cell.comment)
+# A physical drive in an event description, e.g. 'PD 0b(e0x20/s11)': the
+# device ID in hex, then the enclosure device ID and the slot number
+PD_REF_RE = re.compile(r'\bPD ([0-9a-fA-F]+)\(e(0x[0-9a-fA-F]+|\d+)/s(\d+)\)')
 
 
-def section_breaker(custum_list:list, start:int, end:int):
-    # sourcery skip: instance-method-first-arg-name
-    return(custum_list[start:end])
+class DriveIndex():
+    """The events of each physical drive, by the device ID and the Enc/Slot
+    their descriptions mention, to join them with the pdlist Disks.
 
+    Built while the events are classified, so the log isn't scanned again;
+    from_search_dict() rebuilds it for cached or accumulated results.
+    """
+    def __init__(self):
+        # {devID: [(Event, categories)]} and {(EncID, slotNum): [(Event, categories)]}
+        self.by_device = {}
+        self.by_slot = {}
+        # {devID: (EncID, slotNum)} the drive was last mentioned at
+        self.slots = {}
+
+    @classmethod
+    def from_search_dict(cls, search_dict):
+        """Indexes the events of {category: [Event]}, an event in several
+        categories is the same object in each of their lists"""
+        index = cls()
+        categories = {}
+        events = {}
+        for category, category_events in search_dict.items():
+            for event in category_events:
+                categories.setdefault(id(event), []).append(category)
+                events[id(event)] = event
+        for key, event in sorted(events.items(), key=lambda item: seq_key(item[1])):
+            index.add(event, categories[key])
+        return index
+
+    def add(self, event, categories):
+        # Most events don't mention any drive
+        if 'PD ' not in event.description:
+            return
+        for device, enclosure, slot in PD_REF_RE.findall(event.description):
+            device, enclosure, slot = int(device, 16), to_int(enclosure), int(slot)
+            entry = (event, categories)
+            self.by_device.setdefault(device, []).append(entry)
+            self.by_slot.setdefault((enclosure, slot), []).append(entry)
+            self.slots[device] = (enclosure, slot)
+
+    def events(self, device=None, enclosure=None, slot=None):
+        """[(Event, categories)] of a drive in seqNum order, found by its
+        device ID, or by its Enc/Slot when the device ID isn't known. A
+        slot may have held other drives before, a device ID is the drive's."""
+        if device is not None:
+            return self.by_device.get(device, [])
+        return self.by_slot.get((enclosure, slot), [])
+
+
+# Hourly counts this many standard deviations above a category's hourly
+# mean are bursts, if they have at least BURST_MIN_EVENTS events
+BURST_SIGMAS = 3.0
+BURST_MIN_EVENTS = 5
+# Events turned into arrays at a time, so spilled categories stay out of memory
+TREND_CHUNK = 64 * 1024
+
+MONTHS = {month: f'{number:02d}' for number, month in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), start=1)}
+
+
+def iso_time(time):
+    """'Mon Jan  4 10:22:33 2021' -> '2021-01-04T10:22:33', 'NaT' if it isn't one"""
+    try:
+        _, month, day, clock, year = time.split()
+        return f'{year}-{MONTHS[month]}-{int(day):02d}T{clock}'
+    except (AttributeError, ValueError, KeyError):
+        return 'NaT'
+
+
+def datetime_array(np, times):
+    """datetime64[s] array of iso_time() strings, NaT for the invalid ones"""
+    try:
+        return np.array(times, dtype='datetime64[s]')
+    except ValueError:
+        # A malformed clock fails the whole chunk, so parse it one by one
+        def parse(time):
+            try:
+                return np.datetime64(time, 's')
+            except ValueError:
+                return np.datetime64('NaT', 's')
+        return np.array([parse(time) for time in times], dtype='datetime64[s]')
+
+
+def trend_arrays(np, search_dict):
+    """Columns of the events of search_dict, a row per event per category
+    and the rows of a category together: (category codes, seqNums, RTC times
+    as datetime64[s] with NaT for none, seconds since last reboot with NaN
+    for none)"""
+    codes, seq_nums, times, reboots = [], [], [], []
+    for code, events in enumerate(search_dict.values()):
+        events = iter(events)
+        while chunk := list(itertools.islice(events, TREND_CHUNK)):
+            codes.append(np.full(len(chunk), code, dtype=np.int64))
+            seq_nums.append(np.array([-1 if event.seq_num is None else event.seq_num
+                                      for event in chunk], dtype=np.int64))
+            times.append(datetime_array(np, [iso_time(event.time) for event in chunk]))
+            reboots.append(np.array([event.reboot_seconds for event in chunk], dtype=float))
+    if not codes:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype='datetime64[s]'), np.zeros(0, dtype=float))
+    return (np.concatenate(codes), np.concatenate(seq_nums),
+            np.concatenate(times), np.concatenate(reboots))
+
+
+def category_trend(np, times):
+    """Trend of the RTC times of one category's events"""
+    times = times[~np.isnat(times)]
+    trend = {'events_with_time': int(times.size)}
+    if not times.size:
+        return trend, {}, {}
+    hours = times.astype('datetime64[h]').astype(np.int64)
+    days = times.astype('datetime64[D]').astype(np.int64)
+    first_hour, first_day = hours.min(), days.min()
+    # Dense counts over the category's span, the empty buckets included
+    hourly = np.bincount(hours - first_hour)
+    daily = np.bincount(days - first_day)
+
+    def hour(offset):
+        return str(np.datetime64(int(first_hour + offset), 'h'))
+
+    def day(offset):
+        return str(np.datetime64(int(first_day + offset), 'D'))
+
+    peak_hour, peak_day = int(hourly.argmax()), int(daily.argmax())
+    threshold = max(hourly.mean() + BURST_SIGMAS * hourly.std(), BURST_MIN_EVENTS)
+    bursts = np.flatnonzero(hourly >= threshold)
+    trend.update(
+        first=str(times.min()), last=str(times.max()),
+        peak_day=[day(peak_day), int(daily[peak_day])],
+        peak_hour=[hour(peak_hour), int(hourly[peak_hour])],
+        # Least squares slope of the daily counts, positive when the rate grows
+        per_day_slope=round(float(np.polyfit(np.arange(daily.size), daily, 1)[0]), 6)
+        if daily.size > 1 else 0.0,
+        bursts=[[hour(offset), int(hourly[offset])] for offset in bursts],
+    )
+    return (trend, {day(offset): int(daily[offset]) for offset in np.flatnonzero(daily)},
+            {hour(offset): int(hourly[offset]) for offset in np.flatnonzero(hourly)})
+
+
+def reboot_epochs(np, categories, codes, seq_nums, times, reboots):
+    """Event counts of each category per reboot epoch. An epoch starts at an
+    event timed by seconds since last reboot that follows one timed by the
+    RTC, or one with more seconds; epoch 0 is before the first logged reboot."""
+    if not seq_nums.size:
+        return []
+    # Events in several categories have a row in each, one per event here
+    unique_seq_nums, first_rows, event_of_row = np.unique(seq_nums, return_index=True,
+                                                          return_inverse=True)
+    seconds = reboots[first_rows]
+    timed_by_reboot = ~np.isnan(seconds)
+    previous_timed = np.concatenate(([False], timed_by_reboot[:-1]))
+    previous_seconds = np.concatenate(([np.inf], seconds[:-1]))
+    starts = timed_by_reboot & (~previous_timed | (seconds < previous_seconds))
+    epoch_of_event = np.cumsum(starts)
+    epoch_count = int(epoch_of_event[-1]) + 1
+    totals = np.bincount(epoch_of_event[event_of_row] * len(categories) + codes,
+                         minlength=epoch_count * len(categories)).reshape(epoch_count, len(categories))
+    firsts = np.searchsorted(epoch_of_event, np.arange(epoch_count), 'left')
+    lasts = np.searchsorted(epoch_of_event, np.arange(epoch_count), 'right') - 1
+    event_times = times[first_rows]
+    timed = np.flatnonzero(~np.isnat(event_times))
+    # {epoch: its first RTC time}
+    epochs_timed, first_timed = np.unique(epoch_of_event[timed], return_index=True)
+    first_times = dict(zip(epochs_timed.tolist(), event_times[timed[first_timed]].astype(str).tolist()))
+
+    epochs = []
+    for epoch in range(epoch_count):
+        if lasts[epoch] < firsts[epoch]:
+            continue
+        epochs.append({
+            'epoch': epoch,
+            'first_seq_num': int(unique_seq_nums[firsts[epoch]]),
+            'last_seq_num': int(unique_seq_nums[lasts[epoch]]),
+            'first_time': first_times.get(epoch),
+            'events': {category: int(count) for category, count in zip(categories, totals[epoch]) if count},
+        })
+    return epochs
+
+
+def aggregate_trends(search_dict):
+    """Per category counts per day and hour, bursts and trend, and counts
+    per reboot epoch of {category: [Event]}, computed on NumPy arrays.
+    Returns None when NumPy isn't installed."""
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    categories = list(search_dict)
+    codes, seq_nums, times, reboots = trend_arrays(np, search_dict)
+    # The rows of a category are together, in the order of categories
+    bounds = np.searchsorted(codes, np.arange(len(categories) + 1))
+    trends = {'categories': {}, 'daily': {}, 'hourly': {}}
+    for code, category in enumerate(categories):
+        start, end = bounds[code], bounds[code + 1]
+        if end == start:
+            continue
+        trend, daily, hourly = category_trend(np, times[start:end])
+        trends['categories'][category] = {'events': int(end - start), **trend}
+        trends['daily'][category] = daily
+        trends['hourly'][category] = hourly
+    trends['epochs'] = reboot_epochs(np, categories, codes, seq_nums, times, reboots)
+    return trends
+
+
+# Characters that aren't allowed in sheet titles
+SHEET_TITLE_RE = re.compile(r'[\\/*?:\[\]]')
+# openpyxl's own, which isn't imported unless the Excel output is written
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+
+def sheet_cell(value):
+    """Strips the characters Excel can't store from string cell values"""
+    return ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+
+
+class ReportWriter():
+    """Streams sheets into a write-only workbook that is saved once.
+
+    Write-only sheets need their column widths before the first row, so
+    add_sheet sanitizes the rows and measures the widths as it collects them.
+    openpyxl is slow to import, so it's only imported by the writer.
+    """
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        # {sheet title: rows written}
+        self.sheet_rows = {}
+
+    def add_sheet(self, title, rows, padding=0, alignment=None, number_formats=None, widths=None):
+        """Writes rows into a new sheet, number_formats is {column: format}.
+        With the column widths, {column: width}, known up front the rows
+        are streamed into the sheet instead of collected first."""
+        from openpyxl.utils import get_column_letter
+        sheet = self.workbook.create_sheet(SHEET_TITLE_RE.sub('', title)[:31])
+        if widths is not None:
+            dims = widths
+            cleaned_rows = ([sheet_cell(value) for value in row] for row in rows)
+        else:
+            dims = {}
+            cleaned_rows = []
+            for row in rows:
+                row = [sheet_cell(value) for value in row]
+                for column, value in enumerate(row, start=1):
+                    if value:
+                        dims[column] = max(dims.get(column, 0), len(str(value)))
+                cleaned_rows.append(row)
+        for column, width in dims.items():
+            sheet.column_dimensions[get_column_letter(column)].width = width + padding
+        count = 0
+        for row in cleaned_rows:
+            if alignment or number_formats:
+                row = [self.styled_cell(sheet, column, value, alignment, number_formats)
+                       for column, value in enumerate(row, start=1)]
+            sheet.append(row)
+            count += 1
+        self.sheet_rows[sheet.title] = count
+        return sheet
+
+    @staticmethod
+    def styled_cell(sheet, column, value, alignment, number_formats):
+        from openpyxl.cell import WriteOnlyCell
+        cell = WriteOnlyCell(sheet, value=value)
+        if alignment:
+            cell.alignment = alignment
+        if number_formats and column in number_formats and value is not None:
+            cell.number_format = number_formats[column]
+        return cell
+
+    def add_disk_sheet(self, disks):
+        """Writes the Disk_Error_Count sheet, merging each disk's
+        per-disk columns over its error count rows"""
+        from openpyxl.styles import Alignment
+        rows = [('Device ID', 'Enc/Slot', 'Error Count', 'Value',
+                 'Firmware State', 'S.M.A.R.T Alert', 'Size', 'Inquiry Data')]
+        merges = []
+        for disk in disks:
+            disk_rows = disk.rows()
+            start, end = len(rows) + 1, len(rows) + len(disk_rows)
+            merges.extend(f'{column}{start}:{column}{end}' for column in 'ABEFGH')
+            rows.extend(disk_rows)
+            rows.append(())
+        sheet = self.add_sheet(
+            'Disk_Error_Count', rows, padding=4,
+            alignment=Alignment(horizontal='center', vertical='center'),
+            number_formats={4: '0'})
+        for merge in merges:
+            sheet.merged_cells.add(merge)
+        return sheet
+
+    def add_drive_sheets(self, disks, index, categories):
+        """Writes the Drive_Events sheet, the error counts of each drive next
+        to the first and last occurrence of each category of its events, and
+        the Drive_Timeline sheet of its events. The pdlist disks come first,
+        then the drives only the events mention. categories orders the
+        categories of a drive."""
+        order = {category: position for position, category in enumerate(categories)}
+
+        def rank(category):
+            return order.get(category, len(order))
+
+        drives = [(disk.pd_parameters['devID'], disk.pd_parameters['EncID'],
+                   disk.pd_parameters['slotNum'], disk.pd_parameters) for disk in disks]
+        listed = {device for device, _, _, _ in drives}
+        drives.extend((device, *index.slots[device], None)
+                      for device in sorted(index.by_device) if device not in listed)
+
+        summary = [('Device ID', 'Enc/Slot', 'Other Error Count', 'Media Error Count',
+                    'Predictive Failure Count', 'Category', 'Events', 'First Occurrence',
+                    'Last Occurrence')]
+        timeline = [('Device ID', 'Enc/Slot', 'seqNum', 'Time', 'Categories', 'Event Description')]
+        for device, enclosure, slot, pd_params in drives:
+            entries = index.events(device, enclosure, slot)
+            # {category: [events, first Event, last Event]}
+            occurrences = {}
+            for event, event_categories in entries:
+                for category in event_categories:
+                    if category in occurrences:
+                        occurrences[category][0] += 1
+                        occurrences[category][2] = event
+                    else:
+                        occurrences[category] = [1, event, event]
+            counts = (pd_params['otherError'], pd_params['mediaError'], pd_params['predictFail']) \
+                if pd_params else ('Not in pdlist', None, None)
+            drive = (device, f'{enclosure}/{slot}') + counts
+            for category in sorted(occurrences, key=rank):
+                count, first, last = occurrences[category]
+                summary.append(drive + (category, count, f'seqNum {first.seq_num}, {first.when()}',
+                                        f'seqNum {last.seq_num}, {last.when()}'))
+                drive = (None,) * 5
+            if not occurrences:
+                summary.append(drive + ('No events',))
+            summary.append(())
+            for event, event_categories in entries:
+                timeline.append((device, f'{enclosure}/{slot}', event.seq_num, event.when(),
+                                 ', '.join(sorted(event_categories, key=rank)),
+                                 event.description))
+        self.add_sheet('Drive_Events', summary, padding=2)
+        self.add_sheet('Drive_Timeline', timeline, padding=2)
+
+    def add_trends_sheet(self, trends):
+        """Writes the Trends sheet: the trend of each category, then its
+        event counts per reboot epoch"""
+        rows = [('Category', 'Events', 'With RTC Time', 'First', 'Last', 'Peak Day',
+                 'Peak Day Events', 'Peak Hour', 'Peak Hour Events', 'Daily Trend (events/day²)',
+                 'Burst Hours')]
+        for category, trend in trends['categories'].items():
+            row = (category, trend['events'], trend['events_with_time'])
+            if trend['events_with_time']:
+                row += (trend['first'], trend['last'], *trend['peak_day'], *trend['peak_hour'],
+                        trend['per_day_slope'], len(trend['bursts']))
+            rows.append(row)
+        rows.append(())
+        categories = list(trends['categories'])
+        rows.append(('Reboot Epoch', 'First seqNum', 'Last seqNum', 'First RTC Time', *categories))
+        for epoch in trends['epochs']:
+            rows.append((epoch['epoch'], epoch['first_seq_num'], epoch['last_seq_num'], epoch['first_time'],
+                         *(epoch['events'].get(category, 0) for category in categories)))
+        return self.add_sheet('Trends', rows, padding=2)
+
+    def save(self):
+        # A workbook needs at least one sheet
+        if not self.workbook.worksheets:
+            self.workbook.create_sheet('Other')
+        self.workbook.save(self.path)
+
+
+# Columns of an event in the JSONL and CSV outputs, Event.fields() after the category
+EVENT_COLUMNS = ('category', 'seq_num', 'time', 'reboot_seconds', 'code', 'event_class',
+                 'locale', 'description', 'data')
+
+
+def event_rows(search_dict):
+    """(category, *Event.fields()) of each event of search_dict, category by category"""
+    for category, events in search_dict.items():
+        for event in events:
+            yield (category,) + event.fields()
+
+
+class ExcelOutput():
+    """The xlsx report, a sheet per category and Disk_Error_Count"""
+    title = 'Excel'
+    stage = 'excel_maker'
+
+    def write(self, analyzer):
+        analyzer.excel_maker()
+        return [analyzer.final_file]
+
+
+class JsonLinesOutput():
+    """A JSON object per line for each event of each category, then one for
+    each disk, told apart by their 'type'"""
+    title = 'JSONL'
+    stage = 'jsonl_writer'
+
+    def write(self, analyzer):
+        path = analyzer.workspace.path(f'{analyzer.report_name()}.jsonl')
+        with open(path, 'w') as f_obj:
+            for row in event_rows(analyzer.search_dict):
+                f_obj.write(json.dumps({'type': 'event', **dict(zip(EVENT_COLUMNS, row))}) + '\n')
+            for disk in analyzer.disks:
+                f_obj.write(json.dumps({'type': 'disk', **disk.pd_parameters}) + '\n')
+        return [path]
+
+
+class CsvOutput():
+    """The events of each category as CSV rows, the disks in a second CSV"""
+    title = 'CSV'
+    stage = 'csv_writer'
+
+    def write(self, analyzer):
+        paths = [analyzer.workspace.path(f'{analyzer.report_name()}-events.csv')]
+        with open(paths[0], 'w', newline='') as f_obj:
+            writer = csv.writer(f_obj)
+            writer.writerow(EVENT_COLUMNS)
+            writer.writerows(event_rows(analyzer.search_dict))
+        if analyzer.disks:
+            paths.append(analyzer.workspace.path(f'{analyzer.report_name()}-disks.csv'))
+            with open(paths[1], 'w', newline='') as f_obj:
+                writer = csv.DictWriter(f_obj, fieldnames=list(Disk.pd_labels.values()))
+                writer.writeheader()
+                writer.writerows(disk.pd_parameters for disk in analyzer.disks)
+        return paths
+
+
+class TrendsOutput():
+    """The aggregate_trends() JSON, which also adds a Trends sheet to the
+    Excel report of the run"""
+    title = 'trends'
+    stage = 'trends_writer'
+
+    def write(self, analyzer):
+        if analyzer.trends is None:
+            return []
+        path = analyzer.workspace.path(f'{analyzer.report_name()}-trends.json')
+        with open(path, 'w') as f_obj:
+            json.dump(analyzer.trends, f_obj, indent=1)
+        return [path]
+
+
+class SummaryOutput():
+    """Prints the event count and latest events of each category, and the
+    disks with errors, straight from the classifier results. The summary is
+    also kept in a text file, for runs whose output is redirected."""
+    title = 'summary'
+    stage = 'summary'
+    # Latest events shown per category
+    latest = 3
+
+    def write(self, analyzer):
+        lines = [f'{analyzer.org_name} chassis {analyzer.id}, {os.path.basename(analyzer.rc_path())}:']
+        for category, events in analyzer.search_dict.items():
+            lines.append(f'\t{category}: {len(events)}')
+            for event in collections.deque(events, maxlen=self.latest):
+                lines.append(f'\t\tseqNum {event.seq_num}  {event.when()}  {event.description}')
+        failing = [disk.pd_parameters for disk in analyzer.disks
+                   if any(disk.pd_parameters[key] for key in ('otherError', 'mediaError', 'predictFail'))]
+        if analyzer.disks:
+            lines.append(f'\tDisks with error counts: {len(failing)} of {len(analyzer.disks)}')
+        for params in failing:
+            lines.append(f"\t\tDevice {params['devID']} ({params['EncID']}/{params['slotNum']}): "
+                         f"other {params['otherError']}, media {params['mediaError']}, "
+                         f"predictive failure {params['predictFail']}")
+        summary = '\n'.join(lines)
+        print(summary)
+        path = analyzer.workspace.path(f'{analyzer.report_name()}-summary.txt')
+        with open(path, 'w') as f_obj:
+            f_obj.write(summary + '\n')
+        return [path]
+
+
+# Output backends by --format name
+OUTPUTS = {
+    'excel': ExcelOutput,
+    'jsonl': JsonLinesOutput,
+    'csv': CsvOutput,
+    'summary': SummaryOutput,
+    'trends': TrendsOutput,
+}
+
+
+# Format of the results pack_results() makes for pickling
+RESULTS_FORMAT = 1
+
+
+def pack_results(results):
+    """Copy of results, a dict with a search_dict and disks, with its Events
+    and Disks as plain tuples and lists to pickle. These unpickle the same
+    whether the classes came from the script run as __main__ or from the
+    imported module. An event in several categories is stored once."""
+    positions = {}
+    events = []
+    categories = {}
+    for category, category_events in results['search_dict'].items():
+        indexes = categories[category] = []
+        for event in category_events:
+            if id(event) not in positions:
+                positions[id(event)] = len(events)
+                events.append(event.fields())
+            indexes.append(positions[id(event)])
+    disks = results['disks']
+    return dict(results, format=RESULTS_FORMAT, search_dict=(events, categories),
+                disks=None if disks is None else [disk.pd_slice for disk in disks])
+
+
+def unpack_results(packed):
+    """The results of pack_results(), raises ValueError for another format"""
+    if packed.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"Results of format {packed.get('format')}, not {RESULTS_FORMAT}")
+    fields, categories = packed['search_dict']
+    events = [Event(*event_fields) for event_fields in fields]
+    disks = packed['disks']
+    results = dict(packed, disks=None if disks is None else [Disk(pd_slice) for pd_slice in disks],
+                   search_dict={category: [events[index] for index in indexes]
+                                for category, indexes in categories.items()})
+    del results['format']
+    return results
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rclogs')
+CACHE_MAX_MB = 1024
+# Part of every cache key, bump it when the cached objects change or cover
+# other events: 2 has the events of every event log, not only the incremental
+# one, 3 the keywords slot of Event and 4 pack_results()
+CACHE_VERSION = 4
+
+
+class ResultCache():
+    """On-disk cache of analysis results, keyed by a hash of the archive
+    contents and the search categories.
+
+    Each entry is a pickle file of pack_results(), so runs of the script
+    and of the imported module share them; its mtime is bumped on every hit so the
+    least recently used entries are evicted once max_bytes is exceeded.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, archive, categories):
+        digest = hashlib.sha256(f'{CACHE_VERSION}\0{categories!r}\0'.encode())
+        with open(archive, 'rb') as f_obj:
+            while chunk := f_obj.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f'{key}.pickle')
+
+    def load(self, key):
+        """Returns the cached results of key, or None"""
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f_obj:
+                results = unpack_results(pickle.load(f_obj))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, ValueError):
+            return None
+        os.utime(path)
+        return results
+
+    def store(self, key, results):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written aside and moved in place, other runs may be reading it
+        tmp_path = f'{self.entry_path(key)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f_obj:
+            pickle.dump(pack_results(results), f_obj, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.entry_path(key))
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries above max_bytes"""
+        entries = []
+        for file in os.scandir(self.directory):
+            if file.name.endswith('.pickle'):
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+STATE_DIR = os.path.join(os.path.expanduser('~'), '.local', 'share', 'rclogs')
+
+
+class ChassisState():
+    """On-disk store of each chassis's highest analyzed seqNum (its
+    watermark) and its cumulative results, keyed by org name and chassis ID.
+
+    When the categories change, the stored events of a chassis are
+    classified again with the new ones, since the events that have wrapped
+    out of the controller's log can't be analyzed again. It's pickled as pack_results(), so the script and the imported module
+    share it.
+    """
+    def __init__(self, directory=STATE_DIR):
+        self.directory = os.path.abspath(directory)
+
+    def state_path(self, org_name, chassis_id):
+        name = re.sub(r'[^\w.-]', '_', f'{org_key(org_name)}-ID{chassis_id}')
+        return os.path.join(self.directory, f'{name}.pickle')
+
+    def load(self, org_name, chassis_id, categories):
+        """The state of the chassis, a fresh one if it has none yet. A state
+        file that can't be read, e.g. of an older format, is moved aside
+        instead of being replaced by the next save."""
+        path = self.state_path(org_name, chassis_id)
+        try:
+            with open(path, 'rb') as f_obj:
+                chassis = unpack_results(pickle.load(f_obj))
+            if chassis['categories'] != tuple(categories):
+                self.reclassify(chassis, categories)
+            return chassis
+        except FileNotFoundError:
+            pass
+        except (OSError, pickle.UnpicklingError, EOFError, ImportError, AttributeError,
+                KeyError, TypeError, ValueError) as error:
+            aside = f'{path}.unreadable-{datetime.now():%Y%m%d%H%M%S}'
+            os.replace(path, aside)
+            print(f'\tUnreadable chassis state ({type(error).__name__}: {error}), moved to {aside}')
+        return {'categories': tuple(categories), 'watermark': None, 'search_dict': {}, 'disks': None}
+
+    @staticmethod
+    def reclassify(chassis, categories):
+        """Sorts the stored events of chassis into categories instead"""
+        events = {}
+        for category_events in chassis['search_dict'].values():
+            for event in category_events:
+                events[id(event)] = event
+        print(f"\tThe categories changed, classifying {len(events)} stored events again...")
+        chassis['search_dict'] = Classifier(categories).classify(sorted(events.values(), key=seq_key))
+        chassis['categories'] = tuple(categories)
+
+    def update(self, chassis, search_dict, disks=None):
+        """Appends the newly analyzed events and moves the watermark past them"""
+        for category, events in search_dict.items():
+            chassis['search_dict'].setdefault(category, []).extend(events)
+        seq_nums = [event.seq_num for events in search_dict.values()
+                    for event in events if event.seq_num is not None]
+        if seq_nums:
+            chassis['watermark'] = max(seq_nums + [chassis['watermark'] or 0])
+        # pdlist is a snapshot, the latest one wins
+        if disks is not None:
+            chassis['disks'] = disks
+
+    def save(self, org_name, chassis_id, chassis):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.state_path(org_name, chassis_id)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f_obj:
+            pickle.dump(pack_results(chassis), f_obj, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+class EventDatabase():
+    """SQLite store of the events and disks of every analyzed chassis, so
+    fleet wide questions are single indexed queries, e.g.
+
+        SELECT DISTINCT e.org, e.chassis_id FROM events e
+        JOIN event_categories c ON c.event_id = e.id
+        WHERE c.category = 'Fatal firmware error'
+          AND e.timestamp >= datetime('now', '-30 days');
+
+    An event is stored once per org, chassis and seqNum, so analyzing
+    overlapping captures doesn't duplicate it. Events without a seqNum,
+    which nothing tells apart across captures, aren't stored. The disks
+    of a chassis are replaced by those of its latest pdlist. Orgs are
+    stored as org_key(), so 'Acme' and 'acme' are the same fleet rows.
+    """
+    schema = (
+        '''CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            org TEXT NOT NULL,
+            chassis_id TEXT NOT NULL,
+            seq_num INTEGER,
+            time TEXT,
+            timestamp TEXT,
+            reboot_seconds INTEGER,
+            code INTEGER,
+            class INTEGER,
+            locale INTEGER,
+            description TEXT,
+            data TEXT,
+            UNIQUE (org, chassis_id, seq_num))''',
+        '''CREATE TABLE IF NOT EXISTS event_categories (
+            event_id INTEGER NOT NULL REFERENCES events (id),
+            category TEXT NOT NULL,
+            PRIMARY KEY (event_id, category))''',
+        '''CREATE TABLE IF NOT EXISTS disks (
+            org TEXT NOT NULL,
+            chassis_id TEXT NOT NULL,
+            dev_id INTEGER,
+            enc_id INTEGER,
+            slot_num INTEGER,
+            other_error INTEGER,
+            media_error INTEGER,
+            predict_fail INTEGER,
+            fw_state TEXT,
+            smart_alert TEXT,
+            size TEXT,
+            inquiry TEXT,
+            analyzed_at TEXT)''',
+        'CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)',
+        'CREATE INDEX IF NOT EXISTS events_chassis ON events (chassis_id, org)',
+        'CREATE INDEX IF NOT EXISTS event_categories_category ON event_categories (category, event_id)',
+        'CREATE INDEX IF NOT EXISTS disks_enc_slot ON disks (enc_id, slot_num)',
+        'CREATE INDEX IF NOT EXISTS disks_chassis ON disks (chassis_id, org)',
+    )
+    # Rows per executemany transaction
+    batch_size = 10000
+
+    def __init__(self, path):
+        # Batch workers share the file, a writer waits for the others' locks
+        self.connection = sqlite3.connect(path, timeout=300)
+        with self.connection:
+            for statement in self.schema:
+                self.connection.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+    def executemany_batched(self, statement, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with self.connection:
+                    self.connection.executemany(statement, batch)
+                batch = []
+        if batch:
+            with self.connection:
+                self.connection.executemany(statement, batch)
+
+    def add_events(self, org_name, chassis_id, search_dict):
+        """Inserts the events of search_dict, {category: [Event]}, tagged
+        with their categories. An event in several categories is only
+        stored the first time, through the unique seqNum; one without a
+        seqNum isn't stored."""
+        org_name = org_key(org_name)
+        def event_row(event):
+            timestamp = event.timestamp()
+            return (org_name, chassis_id, event.seq_num, event.time,
+                    timestamp.isoformat(' ') if timestamp else None, event.reboot_seconds,
+                    event.code, event.event_class, event.locale, event.description, event.data)
+
+        self.executemany_batched(
+            'INSERT OR IGNORE INTO events (org, chassis_id, seq_num, time, timestamp, reboot_seconds, '
+            'code, class, locale, description, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (event_row(event) for events in search_dict.values() for event in events
+             if event.seq_num is not None))
+        self.executemany_batched(
+            'INSERT OR IGNORE INTO event_categories (event_id, category) '
+            'SELECT id, ? FROM events WHERE org = ? AND chassis_id = ? AND seq_num = ?',
+            ((category, org_name, chassis_id, event.seq_num)
+             for category, events in search_dict.items() for event in events
+             if event.seq_num is not None))
+
+    def add_disks(self, org_name, chassis_id, disks):
+        org_name = org_key(org_name)
+        analyzed_at = datetime.now().isoformat(' ', 'seconds')
+        with self.connection:
+            self.connection.execute('DELETE FROM disks WHERE org = ? AND chassis_id = ?',
+                                    (org_name, chassis_id))
+        self.executemany_batched(
+            'INSERT INTO disks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((org_name, chassis_id) + tuple(disk.pd_parameters[key] for key in (
+                'devID', 'EncID', 'slotNum', 'otherError', 'mediaError', 'predictFail',
+                'fwState', 'smartAlert', 'size', 'inquiry')) + (analyzed_at,)
+             for disk in disks))
+
+
+class RunMetrics():
+    """Wall time, CPU time, peak memory, bytes read and written and
+    event/row counts of each stage of a run, plus per category counts.
+
+    Peak RSS is the process's peak so far, trace_memory also records the
+    peak of Python allocations within each stage through tracemalloc,
+    at the cost of slowing the stages down.
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.report = {'started': datetime.now().isoformat(' ', 'seconds'),
+                       'stages': {}, 'categories': {}}
+
+    @contextmanager
+    def stage(self, name):
+        """Measures the with block as stage name, the yielded dict takes
+        any counts the stage wants to add"""
+        measured = {}
+        if self.trace_memory:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield measured
+        finally:
+            measured['wall_seconds'] = round(time.perf_counter() - wall, 6)
+            measured['cpu_seconds'] = round(time.process_time() - cpu, 6)
+            measured['peak_rss_mb'] = round(peak_rss_mb(), 1)
+            if self.trace_memory:
+                measured['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+                if not tracing:
+                    tracemalloc.stop()
+            self.report['stages'][name] = measured
 
-def num_of_lines(file_obj):
-    with open (file_obj, 'r') as f_obj:
-        return(len(f_obj.readlines()))
+    def category(self, name, **counts):
+        self.report['categories'].setdefault(name, {}).update(counts)
 
+    def write(self, path):
+        stages = self.report['stages'].values()
+        self.report['wall_seconds'] = round(sum(stage['wall_seconds'] for stage in stages), 6)
+        self.report['cpu_seconds'] = round(sum(stage['cpu_seconds'] for stage in stages), 6)
+        with open(path, 'w') as f_obj:
+            json.dump(self.report, f_obj, indent=2)
 
-class Disk():
-    def __init__(self, pd_slice):
-        self.pd_parameters = {
-            'devID' : '',
-            'EncID' : '',
-            'slotNum' : '',
-            'otherError' : '',
-            'mediaError' : '',
-            'predictFail' : '',
-        }
-        self.pd_slice = pd_slice
-        self.get_pd_params()
 
-    def get_pd_params(self):
-        for line in self.pd_slice:
-            if 'Device Id' in line:
-                self.pd_parameters['devID'] = int(line[10:].strip())
-            if 'Enclosure Device ID' in line:
-                self.pd_parameters['EncID'] = int(line[20:].strip())
-            if 'Slot Number' in line:
-                self.pd_parameters['slotNum'] = int(line[12:].strip())
-            if 'Other Error Count:' in line:
-                self.pd_parameters['otherError'] = line[18:].strip()
-            if 'Media Error Count:' in line:
-                self.pd_parameters['mediaError'] = line[18:].strip()
-            if 'Predictive Failure Count:' in line:
-                self.pd_parameters['predictFail'] = line[25:].strip()
-
-
-class Chaos():
-    def __init__(self, pdlist):
-        self.pd_section_indices = []
-        # List of pdlist lines
-        self.pdlist_list = []
-        # {disk-no: [list of pdlist lines for the Disk-#num]}
-        self.pdlist_dict = {}
-        self.pdlist = pdlist
-        self.pdlist_last_line = num_of_lines(self.pdlist)
-
-        # Read pdlist and extend pdlist list
-        with open(self.pdlist, 'r') as f_obj:
-            self.pdlist_list.extend(iter(f_obj))
-
-    def pdlist_slicer(self):
-        """Get pdlist sections line indices"""
-        self.pd_section_indices = [i for i, x in enumerate(self.pdlist_list) if "Enclosure Device ID" in x]
-
-        for i in range(len(self.pd_section_indices)):
-            if i + 1 < len(self.pd_section_indices):
-                self.pdlist_dict[f'Disk-{i}'] = section_breaker(self.pdlist_list, self.pd_section_indices[i], self.pd_section_indices[i+1])
-            else:
-                self.pdlist_dict[f'Disk-{i}'] = section_breaker(self.pdlist_list, self.pd_section_indices[i], self.pdlist_last_line)
+def measure(metrics, name):
+    """metrics.stage(name), or a no-op when the run isn't measured"""
+    return metrics.stage(name) if metrics else nullcontext({})
 
 
-def excel_maker(pd_params, excel_file):
-    E_S = f"{pd_params['EncID']}/{pd_params['slotNum']}"
-    rows = (
-        # ('Device ID', 'Enc/Slot', 'Error Count', 'Value'),
-        (pd_params['devID'], E_S, 'Other Error Count', pd_params['otherError']),
-        (None, None, 'Media Error Count', pd_params['mediaError']),
-        (None, None, 'Predictive Failure Count', pd_params['predictFail'])
-    )
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
 
 
-    workbook = openpyxl.load_workbook(excel_file)
-    sheet = workbook["Disk_Error_Count"]
-    for row in rows:
-        sheet.append(row)
-    sheet.append(('', '', '', ''))
-    workbook.save(f"{excel_file}")
-
-
-def excel_modifier():
-    """Sets the column width sizes of each sheet to the appropriate value"""
-    # Gets the excel file
-    for file in os.scandir():
-        if 'pd_temp.xlsx' in file.name:
-            excel_file = file.name
-            excel_file = os.path.join(os.getcwd(), excel_file)
-    workbook = openpyxl.load_workbook(excel_file)
-    sheet = workbook["Disk_Error_Count"]
-    center_align = Alignment(horizontal='center', vertical='center')
-
-
-    dims = {}
-    for row in sheet.rows:
-        for cell in row:
-            cell.alignment = center_align
-            if cell.value:
-                dims[cell.column_letter] = max((dims.get(cell.column_letter, 0), len(str(cell.value))))
-
-    for col, value in dims.items():
-        sheet.column_dimensions[col].width = value + 4
-
-    a_value_indexes = []
-    b_value_indexes = []
-    c_empty_indexes = []
-    for index, column in enumerate(sheet.columns):
-        if 'A' in get_column_letter(index + 1):
-            a_value_indexes.extend((cell.row, cell.column) for cell in column if cell.value)
-        if 'B' in get_column_letter(index + 1):
-            b_value_indexes.extend((cell.row, cell.column) for cell in column if cell.value)
-        if 'C' in get_column_letter(index + 1):
-            c_empty_indexes.extend(cell.row - 1 for cell in column if not cell.value)
-
-        # Formatting Columns D & E as number
-        if 'D' or 'E' in get_column_letter(index + 1):
-            for cell in column:
-                if cell.value:
-                    cell.number_format = '0'
-
-    for indice, cell in zip(c_empty_indexes, a_value_indexes):
-        sheet.merge_cells(start_row=cell[0], end_row=indice, start_column=cell[1], end_column=cell[1])
-    for indice, cell in zip(c_empty_indexes, b_value_indexes):
-        sheet.merge_cells(start_row=cell[0], end_row=indice, start_column=cell[1], end_column=cell[1])
-
-    workbook.save(excel_file)
+def load_hook(spec):
+    """'module:function' -> the function, for --metrics-hook"""
+    module, _, function = spec.partition(':')
+    return getattr(importlib.import_module(module), function)
 
 
 def get_rm_junk():
@@ -207,14 +1358,268 @@ def pdlist():
     return analyze == 'y'
 
 
+# Candidate archive passwords, a CSV with org and password columns, '*' for any org
+PASSWORDS_FILE = os.path.join(os.path.expanduser('~'), '.config', 'rclogs', 'passwords.csv')
+
+# Bytes of an encrypted member decrypted at a time, and read to try a password
+DECRYPT_CHUNK_BYTES = 1024 * 1024
+PASSWORD_PROBE_BYTES = 1024
+
+
+def read_passwords(passwords_file, org_name):
+    """The candidate passwords of org_name in passwords_file, then the ones
+    of any org, '*'. A missing file has none."""
+    try:
+        with open(passwords_file, newline='') as f_obj:
+            rows = list(csv.DictReader(f_obj))
+    except FileNotFoundError:
+        return []
+    own = [row['password'] for row in rows if org_key(row.get('org')) == org_key(org_name)]
+    return own + [row['password'] for row in rows if str(row.get('org')).strip() == '*']
+
+
+class ZipDecrypter():
+    """Traditional PKWARE (ZipCrypto) decryption, as RCLogs archives are
+    encrypted. zipfile decrypts a byte at a time through method calls; this
+    is the same cipher with the key updates inlined into one loop per chunk
+    and the keystream byte looked up, which is around a third faster. The
+    keys depend on the plaintext so far, so a member is only decrypted
+    from its start, in order."""
+    table = None
+    # Keystream byte of the low 16 bits of key2
+    keystream = None
+
+    def __init__(self, password):
+        if ZipDecrypter.table is None:
+            table = []
+            for byte in range(256):
+                crc = byte
+                for _ in range(8):
+                    crc = (crc >> 1) ^ 0xEDB88320 if crc & 1 else crc >> 1
+                table.append(crc)
+            ZipDecrypter.keystream = bytes(
+                (((key | 2) * ((key | 2) ^ 1)) >> 8) & 0xFF for key in range(0x10000))
+            ZipDecrypter.table = table
+        self.key0, self.key1, self.key2 = 305419896, 591751049, 878082192
+        for byte in password:
+            self.update_keys(byte)
+
+    def update_keys(self, byte):
+        table = self.table
+        self.key0 = (self.key0 >> 8) ^ table[(self.key0 ^ byte) & 0xFF]
+        self.key1 = ((self.key1 + (self.key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+        self.key2 = (self.key2 >> 8) ^ table[(self.key2 ^ (self.key1 >> 24)) & 0xFF]
+
+    def decrypt(self, data):
+        # update_keys inlined, this loop runs once per archive byte
+        table, keystream = self.table, self.keystream
+        key0, key1, key2 = self.key0, self.key1, self.key2
+        out = bytearray()
+        append = out.append
+        for byte in data:
+            byte ^= keystream[key2 & 0xFFFF]
+            append(byte)
+            key0 = (key0 >> 8) ^ table[(key0 ^ byte) & 0xFF]
+            key1 = ((key1 + (key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+            key2 = (key2 >> 8) ^ table[(key2 ^ (key1 >> 24)) & 0xFF]
+        self.key0, self.key1, self.key2 = key0, key1, key2
+        return bytes(out)
+
+
+def check_byte(info):
+    """The byte the encryption header of a member ends with, which tells a
+    wrong password without decrypting the member"""
+    # With a data descriptor the CRC isn't known up front, the time is used
+    return (info._raw_time >> 8) & 0xFF if info.flag_bits & 0x8 else info.CRC >> 24
+
+
+class EncryptedMember(io.RawIOBase):
+    """Readable stream of a stored or deflated ZipCrypto member of the zip
+    at path, decrypted and inflated a chunk at a time as it's read"""
+    def __init__(self, path, info, password):
+        f_obj = open(path, 'rb')
+        f_obj.seek(info.header_offset)
+        header = f_obj.read(30)
+        if header[:4] != b'PK\x03\x04':
+            raise BadZipFile(f'Bad local header of {info.filename}')
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        f_obj.seek(name_length + extra_length, os.SEEK_CUR)
+        self.f_obj = f_obj
+        self.info = info
+        self.decrypter = ZipDecrypter(password)
+        self.header = self.decrypter.decrypt(f_obj.read(12))
+        self.remaining = info.compress_size - 12
+        self.inflater = zlib.decompressobj(-15) if info.compress_type == ZIP_DEFLATED else None
+        self.crc = 0
+        self.pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and self.remaining:
+            chunk = self.f_obj.read(min(self.remaining, DECRYPT_CHUNK_BYTES))
+            if not chunk:
+                raise BadZipFile(f'{self.info.filename} is truncated')
+            self.remaining -= len(chunk)
+            data = self.decrypter.decrypt(chunk)
+            if self.inflater is not None:
+                data = self.inflater.decompress(data)
+                if not self.remaining:
+                    data += self.inflater.flush()
+            self.crc = zlib.crc32(data, self.crc)
+            if not self.remaining and self.crc != self.info.CRC:
+                raise BadZipFile(f'Bad CRC-32 for {self.info.filename}')
+            self.pending = memoryview(data)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        self.f_obj.close()
+        super().close()
+
+
+def password_matches(path, info, password):
+    """Tries password on the encrypted member info of the zip at path: its
+    check byte first, then whether the first bytes of the member decrypt
+    into sane data"""
+    with EncryptedMember(path, info, password) as member:
+        if member.header[11] != check_byte(info):
+            return False
+        # One in 256 wrong passwords gets past the check byte
+        probe = member.decrypter.decrypt(member.f_obj.read(min(member.remaining, PASSWORD_PROBE_BYTES)))
+        if member.inflater is not None:
+            try:
+                probe = member.inflater.decompress(probe)
+            except zlib.error:
+                return False
+    return not (info.filename.lower().endswith('.zip') and len(probe) >= 4
+                and probe[:4] != b'PK\x03\x04')
+
+
+def open_encrypted(path, info, passwords):
+    """Opens the member info of the zip at path with the first of passwords
+    that fits it, each one checked up front and rejected in microseconds.
+    Returns (password, readable stream of the member), the password is None
+    for a member that isn't encrypted."""
+    # An open member keeps the file of the closed ZipFile open
+    if not info.flag_bits & 0x1:
+        with ZipFile(path, 'r') as zip_file:
+            return None, zip_file.open(info)
+    if info.compress_type not in (ZIP_STORED, ZIP_DEFLATED):
+        # Not ZipCrypto, zipfile opens it and checks the passwords itself
+        with ZipFile(path, 'r') as zip_file:
+            for password in passwords:
+                try:
+                    return password, zip_file.open(info, pwd=password.encode())
+                except RuntimeError:
+                    continue
+    else:
+        password = next((password for password in passwords
+                         if password_matches(path, info, password.encode())), None)
+        if password is not None:
+            return password, EncryptedMember(path, info, password.encode())
+    if not passwords:
+        raise ValueError('No password given for the archive')
+    raise RuntimeError(f'Bad password for {os.path.basename(path)}, '
+                       f'tried {len(passwords)} candidate(s)')
+
+
+# Inner zips up to this size are decrypted into memory, bigger ones into a
+# temporary file their event logs are mapped from (flat memory)
+IN_MEMORY_ZIP_LIMIT = 512 * 1024 * 1024
+
+# Inner zip members the parsers need: {key: lowercase name fragment}
+MEMBER_NAMES = {
+    'incremental': 'megaraid_incremental_log',
+    'all_events': 'allevents',
+    'pdlist': 'pdlist',
+}
+
+
+class Workspace():
+    """The files of one analysis run, handed to its stages as exact paths.
+
+    The outputs, the report and its metrics, are written into directory.
+    Scratch files, the AliLog and extracted logs, go into a tmpfiles-
+    directory of the run's own that cleanup() removes unless keep_scratch
+    is set. Nothing is found by listing a directory, so any number of runs
+    can share one.
+    """
+    def __init__(self, directory=None, keep_scratch=False):
+        self.directory = os.path.abspath(directory or os.getcwd())
+        self.keep_scratch = keep_scratch
+        self.scratch = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name):
+        """Path of an output file of the run"""
+        return os.path.join(self.directory, name)
+
+    def scratch_path(self, name):
+        """Path of a scratch file of the run, its directory is made on first use"""
+        if self.scratch is None:
+            self.scratch = tempfile.mkdtemp(prefix='tmpfiles-', dir=self.directory)
+        return os.path.join(self.scratch, name)
+
+    def cleanup(self):
+        if self.scratch is not None and not self.keep_scratch:
+            dirRemover(self.scratch, ignore_errors=True)
+            self.scratch = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+
 class LogAnalyzer():
-    def __init__(self):
-        self.passwd = self.get_password()
-        self.rm_junk = False
-        self.path = os.getcwd()
-        self.rc_file = ''
-        self.org_name = str(input('Enter organization name: ')).strip()
-        self.id = str(input('Enter chassis ID number: '))
+    def __init__(self, passwd=None, org_name=None, id=None, rc_file=None, workspace=None):
+        """Anything that isn't given is asked for interactively, rc_file is
+        the RCLogs archive path, by default the one in the cwd. The files of
+        the run go into workspace, a Workspace of the cwd by default."""
+        self.passwd = self.get_password() if passwd is None else passwd
+        self.org_name = str(input('Enter organization name: ') if org_name is None else org_name).strip()
+        self.id = str(input('Enter chassis ID number: ') if id is None else id)
+        self.workspace = workspace or Workspace()
+        self.path = os.path.dirname(os.path.abspath(rc_file)) if rc_file else os.getcwd()
+        self.rc_file = os.path.basename(rc_file) if rc_file else ''
+        # {MEMBER_NAMES key: file path, or member name when in_memory}
+        self.members = {}
+        # Passwords tried after passwd, see candidate_passwords
+        self.passwords_file = PASSWORDS_FILE
+        self.inner_zip = None
+        # Names of the event logs to analyze, set by extractor
+        self.event_logs = []
+        # Events of the event logs, set by convert_to_alilog
+        self.events = iter(())
+        self.write_alilog = True
+        # Only events with a higher seqNum are analyzed, see ChassisState
+        self.after_seq_num = None
+        # Bytes of buffers a bounded memory run may hold, None keeps it all in memory
+        self.memory_limit = None
+        self.inner_buffer = None
+        # {member name: bytes} of the members inflated up front, see memory_extractor
+        self.member_data = {}
+        # Files and mmaps of the event logs being scanned, see map_log
+        self.mapped = []
+        self.event_count = 0
+        self.categories_file = CATEGORIES_FILE
+        # {category: [Event]}, set by oraganizer
+        self.search_dict = {}
+        # Disk records of pdlist, set by disk_checker
+        self.disks = []
+        # DriveIndex of the events, set by oraganizer
+        self.drive_index = None
+        # aggregate_trends() of the events, set by analyze for the trends output
+        self.trends = None
+        # RunMetrics of the run, if it's measured
+        self.metrics = None
+        # Files written by the output backends, set by analyze
+        self.outputs = []
 
     def get_password(self):
         try:
@@ -222,318 +1627,910 @@ class LogAnalyzer():
         except Exception as error:
             print('ERROR', error)
 
-    def extractor(self):
-        # gets RClogs###.log file path
-        for file in os.scandir(self.path):
-            if 'RCLogs'.lower() in file.name.lower():
-                self.rc_file = file.name
-
-        # renaming rc_file.log to rc_file.zip
-        if self.rc_file[-4:].lower() != '.zip':
-            os.rename(self.rc_file, f'{self.rc_file[:-4]}.zip')
-            self.rc_file = f'{self.rc_file[:-4]}.zip'
-
-        # extracting rc_file.log with the given password
-        with ZipFile(
-                os.path.join(os.getcwd(), self.rc_file), 'r') as zip_ref:
-            zip_ref.extractall(os.getcwd(), pwd=bytes(self.passwd, 'utf-8'))
-
-        # Unzip the extracted zip file whithin RCLogs###.zip
-        for file in os.scandir():
-            if '.zip' in file.name.lower() and 'RCLogs'.lower() not in file.name.lower():
-                self.rc_file = file.name
-
-        with ZipFile(os.path.join(os.getcwd(), self.rc_file), 'r') as zip_ref:
-            zip_ref.extractall(os.getcwd())
-
-        # get AllEvents and Incremental Log files and delete the rest
-        file_list = []
-        for file in os.scandir():
-            if 'allevents' in file.name.lower():
-                all_events = file.name
-            elif 'incremental' in file.name.lower():
-                incremental = file.name
-            elif '.megalog' in file.name.lower():
-                file_list.append(file.name)
-
-        # remove Get_FwTermLog_Controller files
-        for file in os.scandir():
-            if 'Get_FwTermLog_Controller'.lower() in file.name.lower():
-                os.remove(os.path.join(os.getcwd(), file.name))
+    def candidate_passwords(self):
+        """The passwords to try on the archive: the given one, then those of
+        the organization and of any organization in passwords_file"""
+        candidates = [self.passwd] if self.passwd else []
+        for password in read_passwords(self.passwords_file, self.org_name):
+            if password and password not in candidates:
+                candidates.append(password)
+        return candidates
+
+    def open_inner(self):
+        """Returns (ZipInfo, decrypted stream) of the inner zip of the RCLogs
+        archive, with the first candidate password that fits it"""
+        with ZipFile(self.rc_path(), 'r') as outer_zip:
+            inner_info = next(info for info in outer_zip.infolist()
+                              if info.filename.lower().endswith('.zip'))
+        password, stream = open_encrypted(self.rc_path(), inner_info, self.candidate_passwords())
+        if password is not None and password != self.passwd:
+            print('\tOpened with a candidate password of the passwords file')
+            self.passwd = password
+        return inner_info, stream
+
+    def rc_path(self):
+        """Returns the RCLogs archive path, the only one in path if not given"""
+        if not self.rc_file:
+            archives = find_archives([self.path])
+            if not archives:
+                raise FileNotFoundError(f'No RCLogs archive in {self.path}')
+            if len(archives) > 1:
+                raise ValueError(f'{len(archives)} RCLogs archives in {self.path}, '
+                                 'pass the one to analyze')
+            self.rc_file = os.path.basename(archives[0])
+        return os.path.join(self.path, self.rc_file)
+
+    def find_members(self, names):
+        """Picks the members and event logs the parsers need out of the
+        names of the inner zip"""
+        for name in names:
+            for key, fragment in MEMBER_NAMES.items():
+                if fragment in os.path.basename(name).lower():
+                    self.members[key] = name
+
+        # Every event log is parsed, the incremental one first
+        self.event_logs = [self.members[key] for key in ('incremental', 'all_events') if key in self.members]
+        self.event_logs.extend(
+            name for name in names
+            if name.lower().endswith('.megalog') and 'fwtermlog' not in name.lower()
+            and name not in self.event_logs)
+
+    def extractor(self, in_memory=False):
+        """Opens the event logs and pdlist of the RCLogs archive, either in
+        memory or extracted into the scratch directory of the workspace"""
+        if in_memory:
+            self.memory_extractor()
+            return
+
+        inner_info, inner_stream = self.open_inner()
+        inner_path = self.workspace.scratch_path(os.path.basename(inner_info.filename))
+        with inner_stream, open(inner_path, 'wb') as f_obj:
+            shutil.copyfileobj(inner_stream, f_obj, DECRYPT_CHUNK_BYTES)
+
+        # Only the members that are analyzed are extracted, under exact paths
+        with ZipFile(inner_path, 'r') as inner_zip:
+            self.find_members(inner_zip.namelist())
+            extracted = {}
+            for name in set(self.event_logs) | set(self.members.values()):
+                extracted[name] = inner_zip.extract(name, self.workspace.scratch_path('logs'))
+        os.remove(inner_path)
+        self.members = {key: extracted[name] for key, name in self.members.items()}
+        self.event_logs = [extracted[name] for name in self.event_logs]
+
+    def memory_extractor(self):
+        """Opens the inner zip straight from the password protected RCLogs
+        archive, without renaming it or extracting its members.
+
+        The inner zip is decrypted once, as a stream, into a buffer that
+        ZipFile seeks around cheaply, in memory up to IN_MEMORY_ZIP_LIMIT.
+        The members of one in memory, independent deflate streams, are then
+        inflated concurrently on threads since zlib does so outside the GIL.
+        """
+        inner_info, inner_stream = self.open_inner()
+        if self.memory_limit:
+            # Bounded memory, past its share of the limit the spool moves to disk
+            self.inner_buffer = tempfile.SpooledTemporaryFile(max_size=self.memory_limit // 2)
+        elif inner_info.file_size <= IN_MEMORY_ZIP_LIMIT:
+            self.inner_buffer = io.BytesIO()
+        else:
+            self.inner_buffer = tempfile.TemporaryFile()
+        with inner_stream:
+            shutil.copyfileobj(inner_stream, self.inner_buffer, DECRYPT_CHUNK_BYTES)
+        self.inner_buffer.seek(0)
+        self.inner_zip = ZipFile(self.inner_buffer, 'r')
+        self.find_members(self.inner_zip.namelist())
+
+        if not isinstance(self.inner_buffer, io.BytesIO):
+            return
+        names = list(dict.fromkeys(self.event_logs + list(self.members.values())))
+        with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+            self.member_data = dict(zip(names, executor.map(self.inner_zip.read, names)))
+
+    def member_size(self, key):
+        """Uncompressed size of an extracted file or in-memory member"""
+        return self.log_size(self.members[key]) if key in self.members else 0
+
+    def open_member(self, key):
+        """Returns a text stream of an extracted file or in-memory member"""
+        return self.open_log(self.members[key])
+
+    def log_size(self, name):
+        if name in self.member_data:
+            return len(self.member_data[name])
+        if self.inner_zip is not None:
+            return self.inner_zip.getinfo(name).file_size
+        return os.path.getsize(name)
+
+    def open_log(self, name):
+        if name in self.member_data:
+            return io.TextIOWrapper(io.BytesIO(self.member_data[name]))
+        if self.inner_zip is not None:
+            return io.TextIOWrapper(self.inner_zip.open(name))
+        return open(name, 'r')
+
+    def map_log(self, name):
+        """Returns the bytes of an event log to scan: the in-memory member,
+        or a read only mmap of the extracted file. A member of an inner zip
+        that isn't in memory is copied into a temporary file to be mapped."""
+        if name in self.member_data:
+            return self.member_data[name]
+        if self.inner_zip is not None:
+            f_obj = tempfile.TemporaryFile()
+            with self.inner_zip.open(name) as member:
+                shutil.copyfileobj(member, f_obj, 1024 * 1024)
+        else:
+            f_obj = open(name, 'rb')
+        self.mapped.append(f_obj)
+        # An empty file can't be mapped
+        if os.fstat(f_obj.fileno()).st_size == 0:
+            return b''
+        self.mapped.append(mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ))
+        return self.mapped[-1]
+
+    def close(self):
+        for mapped in reversed(self.mapped):
+            mapped.close()
+        self.mapped = []
+        self.member_data = {}
+        for zip_file in (self.inner_zip, self.inner_buffer):
+            if zip_file is not None:
+                zip_file.close()
+        self.inner_zip = self.inner_buffer = None
 
     def convert_to_alilog(self):
-        # Gets Megaraid_Incremental_Log path
-        for file in os.scandir():
-            if 'MegaRAID_Incremental_Log'.lower() in file.name.lower():
-                inc_log_full_path = os.path.join(os.getcwd(), file.name)
-                inc_log = file.name
-
-        # Read Incremental Log File
-        with open(inc_log, 'r') as f_obj:
-            log_file = f_obj.readlines()
-
-        # make a list of Inc_log lines
-        # make a list of where each new message begins in the log_list
-        log_list = list(log_file)
-        section_indices = [i for i, x in enumerate(log_list) if "seqNum" in x]
-
-
-        # Making a full line out of each message
-        # Then Writing the full line to alilog file.
-        complete_line = ''
-        complete_lines = []
-        for i in range(len(section_indices)):
-            complete_line = ''
-            if section_indices[i] != section_indices[-1]:
-                for line in (log_list[section_indices[i]:section_indices[i+1]]):
-                    complete_line += line.replace('\n', '  ')
-            # Making an exception just for the last item in section_indices
-            else:
-                for line in (log_list[section_indices[i]:]):
-                    complete_line += line.replace('\n', '  ')
-            complete_line = '\n' + complete_line
-            complete_lines.append(complete_line)
-
-        # Write each line to the GetEventsToAlilog
-        with open(f'GetEventsToAlilog-{inc_log}', 'w') as f_obj:
-            f_obj.writelines(complete_lines)
+        """Sets up the seqNum ordered stream of Events that oraganizer
+        consumes and, if write_alilog is set, tees the incremental log's
+        records into the GetEventsToAlilog file.
+
+        A single event log is parsed lazily as it's consumed. Several are
+        parsed up front, concurrently on a process pool once they're big
+        enough to pay for it, and k-way merged without repeated seqNums.
+        With memory_limit they're all parsed lazily instead, which relies
+        on each log being in seqNum order, as the firmware writes them.
+        """
+        logs = [(name, self.workspace.scratch_path(f'GetEventsToAlilog-{os.path.basename(name)}')
+                 if self.write_alilog and name == self.members.get('incremental') else None)
+                for name in self.event_logs]
+
+        terms = scan_terms(load_categories(self.categories_file))
+        if len(logs) == 1 or self.memory_limit:
+            streams = [scan_event_log(self.map_log(name), self.after_seq_num, alilog, terms)
+                       for name, alilog in logs]
+            self.events = streams[0] if len(streams) == 1 else merge_events(streams)
+            return
+
+        if ((os.cpu_count() or 1) < 2
+                or sum(self.log_size(name) for name, _ in logs) < PARALLEL_PARSE_MIN_BYTES):
+            streams = [parse_event_log(self.map_log(name), self.after_seq_num, alilog, terms)
+                       for name, alilog in logs]
+        else:
+            streams = self.parallel_parser(logs, terms)
+        self.events = merge_events(streams)
+
+    def parallel_parser(self, logs, terms=None):
+        """Parses [(log name, alilog path or None)] on a process pool, split
+        into chunks at seqNum lines so a single big log is parsed by several
+        workers too. Returns a seqNum sorted list of Events per chunk.
+
+        The AliLog files are written here while the workers parse, their
+        records have to reach them in order.
+        """
+        workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            alilogs = []
+            for name, alilog in logs:
+                data = self.map_log(name)
+                pieces = min(workers, max(1, len(data) // PARSE_CHUNK_BYTES))
+                futures.extend(executor.submit(parse_event_chunk, chunk, self.after_seq_num, terms)
+                               for chunk in split_log(data, pieces))
+                if alilog:
+                    alilogs.append((data, alilog))
+            for data, alilog in alilogs:
+                write_alilog(data, self.after_seq_num, alilog)
+            # Rebuilt from plain tuples, which pickle far faster than objects
+            return [[Event(*fields) for fields in future.result()] for future in futures]
 
     def oraganizer(self):
-        # Get AliLog path
-        path = os.getcwd()
-        for file in os.scandir():
-            if 'geteventstoalilog' in file.name.lower():
-                ali_log = os.path.join(os.getcwd(), file.name)
-
-        # Read Alilog lines and store them in a list
-        log_lines = []
-        with open(ali_log) as file_obj:
-            log_lines.extend(iter(file_obj))
-
-
-        # Function to look for a search term in log_lines
-        # item is one of the search_dict terms and
-        # logs is a list of all the RC_Log_Lines
-        def searcher(item, logs):
-            print(f'\tLooking for "{item.capitalize()}" in AliLog...')
-            # print([line for line in logs if item.lower() in line.lower()])
-            return [line for line in logs if item.lower() in line.lower()]
-
-
-        # Categories to search for in log file:
-        # Other Category isn't defined
-        search_dict = {
-            'Power state change': [],
-            'Unexpected sense': [],
-            'medium error': [],
-            'Uncorrectable': [],
-            'recovery': [],
-            'Fatal firmware error': [],
-            'DEGRADED': [],
-            'State change on VD': [],
-            'State change on PD': [],
-            'Consistency Check st': [],
-            'Consistency Check done': [],
-            'abort': [],
-            'inconsistent': [],
-            'Battery': [],
-            'Rebuild complete': [],
-            'Rebuild failed': [],
-            'Rebuild automatically started': [],
-            'Rebuild started': []
-            # 'ECC': []
-            # 'Other': []
-        }
-
-        # Fill the value of each search_term with relevant lines from RC_Logs
-        for k in search_dict:
-            search_dict[k] = searcher(k, log_lines)
-
-        # defining Other section
-        other_list = []
-        print('\tLooking for "Other" in AliLog...')
-        for line in log_lines:
-            for item in search_dict:
-                if item != 'Other' and item.lower() in line.lower():
-                    break
-            else:
-                other_list.append(line)
-        search_dict['Other'] = other_list
+        # Put every event record into each category it mentions, or Other
+        classifier = Classifier(load_categories(self.categories_file))
+        print(f'\tLooking for {len(classifier.categories)} categories in AliLog...')
+        # With memory_limit the categories are spilled to disk as they fill,
+        # and the drive index, which would hold on to events, isn't built
+        self.drive_index = None if self.memory_limit else DriveIndex()
+        search_dict = classifier.classify(self.events, SpilledEvents if self.memory_limit else list,
+                                          self.drive_index)
+        self.event_count = classifier.event_count
+        for item, lines in search_dict.items():
+            print(f'\t\t"{item.capitalize()}": {len(lines)}')
 
 
-        def alilog_list(lines):
-            mylist = []
-            for line in lines:
-                time = re.search("Time:.([A-zZ-a]*).([A-zZ-a]*) *[0-9]* *([0-9]*:[0-9]*:[0-9]*) [0-9]*", line)
-                reboot = re.search("Seconds since last reboot:.[0-9]*", line)
-                description = re.search("Event Description: .* (?=Event Data)", line)
-                data = re.search("Event Data: .*", line)
-                if reboot:
-                    mylist.append([reboot.group().strip(), description.group().strip(), data.group().strip()])
-                if time:
-                    mylist.append([time.group().strip(), description.group().strip(), data.group().strip()])
+        self.search_dict = search_dict
 
-            return(mylist)
-
-
-        for item in search_dict:
-            list_of_lines = alilog_list(search_dict[item])
-            with open(
-                os.path.join(os.getcwd(), f'{item}.csv'), 'w', newline='') as obj:
-                csv_writer = csv.writer(obj)
-                csv_writer.writerows(list_of_lines)
+    def report_name(self):
+        return f"{self.org_name.capitalize()}-ID{self.id}-RC_Log_Analyze-{date.today().strftime('%B-%d-%Y')}"
 
     def excel_maker(self):
-        workbook = openpyxl.Workbook()
-        workbook.save(f"{self.org_name.capitalize()}-ID{self.id}-RC_Log_Analyze-{date.today().strftime('%B-%d-%Y')}.xlsx")
-
-        # Write each csv to the excel file
-        def excel_writer(sheet_name, csv_path):
-            for file in os.scandir():
-                if '.xlsx' in file.name:
-                    self.final_file = file.name
-            rows = []
-            with open(csv_path) as f_obj:
-                csv_reader = csv.reader(f_obj)
-                rows.extend(iter(csv_reader))
-            workbook = openpyxl.load_workbook(self.final_file)
-            sheet = workbook.create_sheet(sheet_name)
-            # column = j
-            j = 1
-            sheet = workbook[sheet_name]
-            for i, row in enumerate(rows, start=1):
-                for j, item in enumerate(row, start=1):
-                    try:
-                        sheet.cell(row=i, column=j, value=item)
-                    except openpyxl.utils.exceptions.IllegalCharacterError:
-                        sheet.cell(row=i, column=j, value=ILLEGAL_CHARACTERS_RE.sub(r'', item))
-            workbook.save(f"{self.org_name.capitalize()}-ID{self.id}-RC_Log_Analyze-{date.today().strftime('%B-%d-%Y')}.xlsx")
-
-
-        # Get CSV files within the folder and store them in a dict
-        path_dict = {}
-
-
-        def csv_files(path):
-            for file in os.scandir(path):
-                if ('.csv' in file.name and
-                        os.path.getsize(os.path.join(path, file.name)) != 0):
-                    path_dict[f'{file.name[:-4]}'] = (os.path.join(path, file.name))
-
-
-        csv_files(os.getcwd())
-
-        for file_name, file_path in path_dict.items():
-            excel_writer(file_name, file_path)
-
-        workbook = openpyxl.load_workbook(self.final_file)
-        workbook.remove(workbook['Sheet'])
-        workbook.save(self.final_file)
-
-    def excel_modifier(self):
-        """Sets the column width sizes of each sheet to the appropriate value"""
-        # Gets the excel file
-        for file in os.scandir():
-            if '.xlsx' in file.name:
-                excel_file = file.name
-        excel_file = os.path.join(os.getcwd(), excel_file)
-
-        #2 Copied from https://stackoverflow.com/questions/13197574/openpyxl-adjust-column-width-size
-        workbook = openpyxl.load_workbook(excel_file)
-        for i in workbook.sheetnames:
-            sheet = workbook[i]
-            sheet
-            dims = {}
-            for row in sheet.rows:
-                for cell in row:
-                    if cell.value:
-                        dims[cell.column_letter] = max((dims.get(cell.column_letter, 0), len(str(cell.value))))
-            for col, value in dims.items():
-                sheet.column_dimensions[col].width = value
-        workbook.save(excel_file)
-
-    def junk_remove(self):
-        csv_list = [file.name for file in os.scandir() if '.csv' in file.name.lower()]
-        megalog_list = [file.name for file
-                        in os.scandir() if '.megalog' in file.name.lower()]
-        zip_list = [file.name for file in os.scandir() if '.zip' in file.name.lower() and 'rclogs' not in file.name.lower()]
-        junk_list = csv_list + megalog_list + zip_list
-
-        tmp_folder = os.path.join(os.getcwd(), 'tmpfiles')
-
-        if self.rm_junk:
-            for file in junk_list:
-                os.remove(os.path.join(os.getcwd(), file))
+        """Writes each category of oraganizer straight into the report,
+        in a single save"""
+        self.final_file = self.workspace.path(f"{self.report_name()}.xlsx")
+        report = ReportWriter(self.final_file)
+        for item, events in self.search_dict.items():
+            if events:
+                start = time.perf_counter()
+                sheet = report.add_sheet(item, (row for event in events for row in event.rows()),
+                                         widths=getattr(events, 'widths', None))
+                if self.metrics:
+                    self.metrics.category(item, sheet_rows=report.sheet_rows[sheet.title],
+                                          sheet_seconds=round(time.perf_counter() - start, 6))
+        if self.disks:
+            report.add_disk_sheet(self.disks)
+        if self.drive_index is not None and (self.disks or self.drive_index.by_device):
+            report.add_drive_sheets(self.disks, self.drive_index, list(self.search_dict))
+        if self.trends:
+            report.add_trends_sheet(self.trends)
+        report.save()
+
+    def database_writer(self, database):
+        """Adds the events of each category and the disks to the database"""
+        with EventDatabase(database) as event_db:
+            event_db.add_events(self.org_name, self.id, self.search_dict)
+            if self.disks:
+                event_db.add_disks(self.org_name, self.id, self.disks)
+
+    def disk_checker(self):
+        """Reads the Disk records of the pdlist file"""
+        if 'pdlist' not in self.members:
+            print('\tNo pdlist file found in the RC logs')
+            return
+        self.disks = list(read_pdlist(self.open_member('pdlist')))
+
+
+def analyze(analyzer, check_pdlist=True, cache=None, state=None, database=None, outputs=('excel',),
+            metrics=False, trace_memory=False, metrics_hooks=(), memory_limit=None, passwords_file=None,
+            categories_file=None, extract=False):
+    """Runs the analysis stages of analyzer and writes each of outputs, names
+    of OUTPUTS backends. Returns the path of the first file they wrote, or
+    the database path if they wrote none; analyzer.outputs has them all.
+
+    With a database path the events and disks are also added to that
+    SQLite EventDatabase.
+
+    With a ResultCache, an archive analyzed before with the same categories
+    only has its report rendered again from the cached results. With a
+    ChassisState, only the events newer than the chassis's last analyzed
+    seqNum are parsed and the report covers all of its analyzed events.
+
+    With metrics, each stage is measured by a RunMetrics that is written
+    as JSON next to the report and handed to each of metrics_hooks.
+
+    With a memory_limit in bytes, the logs are streamed and the categorized
+    events spilled to temporary files, so memory stays flat however big
+    the logs are. Such a run can't use the cache or the chassis state,
+    which keep their results in memory.
+
+    passwords_file replaces the PASSWORDS_FILE of candidate passwords that
+    are tried when the archive's password doesn't fit it, and
+    categories_file the CATEGORIES_FILE of search categories.
+
+    With extract, the event logs and pdlist are extracted into the scratch
+    directory of the workspace and mapped from there, instead of being
+    decrypted into memory; they're kept with the workspace's keep_scratch.
+    """
+    analyzer.memory_limit = memory_limit
+    if passwords_file:
+        analyzer.passwords_file = passwords_file
+    if categories_file:
+        analyzer.categories_file = categories_file
+    if memory_limit and (cache is not None or state is not None):
+        print("Bounded memory run, the cache and chassis state aren't used...")
+        cache = state = None
+    run_metrics = analyzer.metrics = RunMetrics(trace_memory) if metrics else None
+    if run_metrics:
+        run_metrics.report.update(archive=analyzer.rc_path(), org=analyzer.org_name,
+                                  chassis_id=analyzer.id)
+    categories = load_categories(analyzer.categories_file)
+    chassis = None
+    if state is not None:
+        chassis = state.load(analyzer.org_name, analyzer.id, categories)
+        analyzer.after_seq_num = chassis['watermark']
+        # What a run finds depends on the watermark, so its results can't be cached
+        cache = None
+
+    cached = key = None
+    if cache is not None:
+        with measure(run_metrics, 'cache_lookup') as measured:
+            key = cache.key(analyzer.rc_path(), categories)
+            cached = cache.load(key)
+            # A cached run that skipped pdlist can't provide the disks
+            if cached and check_pdlist and cached['disks'] is None:
+                cached = None
+            measured['bytes_read'] = os.path.getsize(analyzer.rc_path())
+            measured['hit'] = bool(cached)
+
+    if cached:
+        print("Using cached results of a previous analysis...")
+        analyzer.search_dict = cached['search_dict']
+        analyzer.disks = cached['disks'] or []
+        analyzer.drive_index = DriveIndex.from_search_dict(analyzer.search_dict)
+    else:
+        print("Extracting zip files...")
+        with measure(run_metrics, 'extractor') as measured:
+            analyzer.extractor(in_memory=not extract)
+            measured['bytes_read'] = os.path.getsize(analyzer.rc_path())
+        try:
+            print("Converting to AliLog...")
+            with measure(run_metrics, 'convert_to_alilog'):
+                analyzer.convert_to_alilog()
+
+            # Records are assembled lazily, so the log is read in here
+            print("Organizing AliLog into categories...")
+            with measure(run_metrics, 'oraganizer') as measured:
+                analyzer.oraganizer()
+                measured['bytes_read'] = sum(analyzer.log_size(name) for name in analyzer.event_logs)
+                measured['events'] = analyzer.event_count
+                measured['rows'] = sum(len(events) for events in analyzer.search_dict.values())
+
+            if check_pdlist:
+                print("Checking Disk Errors")
+                with measure(run_metrics, 'disk_checker') as measured:
+                    analyzer.disk_checker()
+                    measured['bytes_read'] = analyzer.member_size('pdlist')
+                    measured['disks'] = len(analyzer.disks)
+        finally:
+            analyzer.close()
+        if cache is not None:
+            with measure(run_metrics, 'cache_store'):
+                cache.store(key, {'search_dict': analyzer.search_dict,
+                                  'disks': analyzer.disks if check_pdlist else None})
+
+    if chassis is not None:
+        with measure(run_metrics, 'chassis_state'):
+            state.update(chassis, analyzer.search_dict, analyzer.disks if check_pdlist else None)
+            state.save(analyzer.org_name, analyzer.id, chassis)
+        print(f"Appended events up to seqNum {chassis['watermark']} to the chassis results...")
+        analyzer.search_dict = chassis['search_dict']
+        analyzer.disks = chassis['disks'] or []
+        analyzer.drive_index = DriveIndex.from_search_dict(analyzer.search_dict)
+
+    if 'trends' in outputs:
+        print("Aggregating the event trends...")
+        with measure(run_metrics, 'trends') as measured:
+            analyzer.trends = aggregate_trends(analyzer.search_dict)
+            measured['events'] = sum(len(events) for events in analyzer.search_dict.values())
+        if analyzer.trends is None:
+            print("\tNumPy isn't installed, the trends are skipped")
+
+    if database:
+        print("Adding the events to the database...")
+        with measure(run_metrics, 'database_writer') as measured:
+            size = os.path.getsize(database) if os.path.exists(database) else 0
+            analyzer.database_writer(database)
+            measured['bytes_written'] = os.path.getsize(database) - size
+
+    analyzer.outputs = []
+    for name in outputs:
+        backend = OUTPUTS[name]()
+        print(f"Making the {backend.title} output...")
+        with measure(run_metrics, backend.stage) as measured:
+            paths = backend.write(analyzer)
+            measured['bytes_written'] = sum(os.path.getsize(path) for path in paths)
+        analyzer.outputs.extend(paths)
+
+    if run_metrics:
+        for category, events in analyzer.search_dict.items():
+            run_metrics.category(category, events=len(events))
+        run_metrics.write(analyzer.workspace.path(f'{analyzer.report_name()}-metrics.json'))
+        for hook in metrics_hooks:
+            hook(run_metrics.report)
+    if analyzer.outputs:
+        return analyzer.outputs[0]
+    return os.path.abspath(database) if database else None
+
+
+def analyze_archive(archive, org_name, chassis_id, passwd, workspace, **options):
+    """Analyzes one RCLogs archive in its own Workspace of the workspace
+    directory, where the report and the analysis.log of the run are
+    written. options are passed on to analyze().
+
+    Returns {'archive', 'report', 'outputs', 'seconds', 'error'}, failures
+    are reported in 'error' instead of being raised so a batch carries on.
+    """
+    archive = os.path.abspath(archive)
+    result = {'archive': archive, 'report': None, 'outputs': [], 'seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        with Workspace(workspace) as run_workspace, \
+                open(run_workspace.path('analysis.log'), 'w') as log, redirect_stdout(log):
+            # A worker can't prompt for what's missing
+            if org_name is None or chassis_id is None:
+                raise ValueError('No organization name or chassis ID given for the archive')
+            # Without a password the candidates of the passwords file are tried
+            analyzer = LogAnalyzer(passwd or '', org_name, chassis_id, rc_file=archive,
+                                   workspace=run_workspace)
+            analyzer.write_alilog = False
+            result['report'] = analyze(analyzer, **options)
+            result['outputs'] = analyzer.outputs
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+    finally:
+        result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def analyze_archives(jobs, options):
+    """Runs analyze_archive for each (archive, org, id, password, workspace)
+    of jobs, one after the other"""
+    return [analyze_archive(*job, **options) for job in jobs]
+
+
+def is_archive_name(name):
+    """Whether a file in a directory of archives is an RCLogs archive"""
+    return 'rclogs' in os.path.basename(name).lower()
+
+
+def find_archives(paths):
+    """Expands directories in paths to the RCLogs archives within them"""
+    archives = []
+    for path in paths:
+        if os.path.isdir(path):
+            archives.extend(sorted(file.path for file in os.scandir(path)
+                                   if file.is_file() and is_archive_name(file.name)))
         else:
-            os.mkdir(os.path.join(os.getcwd(), 'tmpfiles'))
-            for file in junk_list:
-                os.replace(
-                    os.path.join(os.getcwd(), file), os.path.join(tmp_folder, file))
-
-    def purge(self):
-        """Clears the last RC Analyze files if any are there"""
-        for file in os.scandir():
-            if '.xlsx' in file.name:
-                os.remove(file.name)
-            if 'tmpfiles' in file.name:
-                print("Removing extra files from last Log analayze...")
-                dirRemover(file.name)
-
-
-main = LogAnalyzer()
-main.rm_junk = get_rm_junk()
-
-main.purge()
-
-print("Extracting zip files...")
-main.extractor()
-
-print("Converting to AliLog...")
-main.convert_to_alilog()
-
-print("Organizing AliLog into CSV files...")
-main.oraganizer()
-
-print("Making the Excel output from CSV files...")
-main.excel_maker()
-
-print("Adjusting sheet column width sizes in the Excel file...")
-main.excel_modifier()
-
-if getpd := pdlist():
-    print("Checking Disk Errors")
-    for file in os.scandir(os.getcwd()):
-        if 'pdlist' in file.name.lower():
-            pdlist = file.name
-    smart = Chaos(pdlist)
-    smart.pdlist_slicer()
-
-    disks = {disk: Disk(pd_data) for (disk, pd_data) in smart.pdlist_dict.items()}
-
-    file_list = [file.name for file in os.scandir()]
-    final_file = [file.name for file in os.scandir() if 'RC_Log_Analyze' in file.name]
-    workbook = openpyxl.Workbook()
-    workbook.create_sheet("Disk_Error_Count")
-    workbook.save("pd_temp.xlsx")
-
-    for disk in disks.values():
-        excel_maker(disk.pd_parameters, "pd_temp.xlsx")
-    excel_modifier()
-
-    wb_target = openpyxl.load_workbook(final_file[0])
-    target_sheet = wb_target.create_sheet('Disk_Error_Count')
-
-    wb_source = openpyxl.load_workbook('pd_temp.xlsx')
-    source_sheet = wb_source['Disk_Error_Count']
-
-    copy_sheet(source_sheet, target_sheet)
-
-    if 'Sheet' in wb_target.sheetnames:  # remove default sheet
-        wb_target.remove(wb_target['Sheet'])
-
-    wb_target.save(final_file[0])
-
-print("Dealing with extra created files...")
-main.junk_remove()
-
-print("Done")
+            archives.append(path)
+    return archives
+
+
+def read_mapping(mapping_file):
+    """Reads a CSV with archive, org, id and password columns into
+    {archive: {'org': ..., 'id': ..., 'password': ...}}, keyed by the
+    absolute path of each archive, relative ones being relative to the CSV,
+    and by its file name unless several rows share that name"""
+    base = os.path.dirname(os.path.abspath(mapping_file))
+    with open(mapping_file, newline='') as f_obj:
+        rows = list(csv.DictReader(f_obj))
+    names = collections.Counter(os.path.basename(row['archive']) for row in rows)
+    mapping = {}
+    for row in rows:
+        mapping[os.path.join(base, os.path.expanduser(row['archive']))] = row
+        if names[os.path.basename(row['archive'])] == 1:
+            mapping[os.path.basename(row['archive'])] = row
+    return mapping
+
+
+def outbox_workspace(outbox, archive):
+    """Makes a new workspace directory for archive in outbox, numbered when
+    an archive of the same name came in before or from another directory"""
+    base = os.path.join(os.path.abspath(outbox), os.path.splitext(os.path.basename(archive))[0])
+    workspace, number = base, 1
+    while True:
+        try:
+            os.makedirs(workspace)
+            return workspace
+        except FileExistsError:
+            workspace = f'{base}-{number}'
+            number += 1
+
+
+def mapping_entry(mapping, archive):
+    """The read_mapping() row of archive, by its path or else its file name"""
+    mapping = mapping or {}
+    return mapping.get(os.path.abspath(archive)) or mapping.get(os.path.basename(archive), {})
+
+
+def archive_job(archive, output, org_name=None, chassis_id=None, passwd=None, mapping=None):
+    """The (archive, org, id, password, workspace) analyze_archive job of
+    archive, see batch_analyze. Its workspace is made in output."""
+    entry = mapping_entry(mapping, archive)
+    return (archive, entry.get('org') or org_name, entry.get('id') or chassis_id,
+            entry.get('password') or passwd, outbox_workspace(output, archive))
+
+
+def job_group(job, options):
+    """Jobs of one group have to be analyzed one after the other"""
+    archive, org, chassis = job[:3]
+    # Captures of a chassis sharing its state have to be analyzed one
+    # after the other, the chassis themselves still run concurrently
+    return (org_key(org), str(chassis)) if options.get('state') else archive
+
+
+def batch_analyze(paths, output, org_name=None, chassis_id=None, passwd=None,
+                  mapping=None, jobs=None, **options):
+    """Analyzes every RCLogs archive of paths concurrently on a process pool.
+
+    org_name, chassis_id and passwd apply to every archive unless mapping,
+    {archive path or file name: {'org', 'id', 'password'}} of read_mapping(),
+    has its own values. Each archive gets a new workspace under output,
+    numbered when archives share a name, and options are passed on to
+    analyze(). Returns the results of analyze_archive in the order
+    of the archives.
+    """
+    archives = [os.path.abspath(archive) for archive in find_archives(paths)]
+    groups = {}
+    for archive in archives:
+        job = archive_job(archive, output, org_name, chassis_id, passwd, mapping)
+        groups.setdefault(job_group(job, options), []).append(job)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(analyze_archives,
+                                   sorted(group_jobs, key=lambda job: os.path.getmtime(job[0])),
+                                   options)
+                   for group_jobs in groups.values()]
+        results = {result['archive']: result for future in futures for result in future.result()}
+    return [results[archive] for archive in archives]
+
+
+# Seconds between scans of the inboxes of a watch. Without inotify an
+# archive is only taken once it hasn't been modified for as long.
+WATCH_INTERVAL = 5.0
+# Archives a watch queues beyond the ones being analyzed, the rest wait in the inboxes
+WATCH_MAX_PENDING = 16
+# Times a watch runs an archive whose worker dies, before it's moved to failed/
+WATCH_MAX_ATTEMPTS = 3
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x08
+IN_MOVED_TO = 0x80
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InboxWatcher():
+    """Finds the RCLogs archives that are complete in inbox directories.
+
+    The inboxes are scanned on every ready() call. On Linux, inotify also
+    reports the archives closed after writing or moved in, which are ready
+    right away and wake wait() up; elsewhere an archive is ready once it
+    hasn't been modified for settle seconds, so half-copied ones are left.
+    """
+    def __init__(self, inboxes, settle=WATCH_INTERVAL):
+        self.inboxes = [os.path.abspath(inbox) for inbox in inboxes]
+        self.settle = settle
+        # Archives handed out, skipped while they're still in an inbox
+        self.taken = set()
+        # Archives inotify saw complete
+        self.completed = set()
+        # inotify file descriptor and {watch descriptor: inbox}
+        self.inotify = None
+        self.watches = {}
+        self.start_inotify()
+
+    def start_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return
+        if fd < 0:
+            return
+        for inbox in self.inboxes:
+            watch = libc.inotify_add_watch(fd, os.fsencode(inbox), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if watch < 0:
+                os.close(fd)
+                self.watches = {}
+                return
+            self.watches[watch] = inbox
+        self.inotify = fd
+
+    def read_events(self):
+        while True:
+            try:
+                buffer = os.read(self.inotify, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(buffer):
+                watch, _, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT.size
+                name = buffer[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if watch in self.watches and name and is_archive_name(os.fsdecode(name)):
+                    self.completed.add(os.path.join(self.watches[watch], os.fsdecode(name)))
+
+    def ready(self, limit):
+        """Takes up to limit complete archives of the inboxes, oldest first"""
+        if limit <= 0:
+            return []
+        if self.inotify is not None:
+            self.read_events()
+        now = time.time()
+        candidates = []
+        archives = find_archives(self.inboxes)
+        # Archives that left the inboxes before being taken
+        self.completed.intersection_update(archives)
+        for archive in archives:
+            if archive in self.taken:
+                continue
+            try:
+                modified = os.stat(archive).st_mtime
+            except FileNotFoundError:
+                continue
+            if archive in self.completed or now - modified >= self.settle:
+                candidates.append((modified, archive))
+        ready = [archive for _, archive in sorted(candidates)[:limit]]
+        self.taken.update(ready)
+        self.completed.difference_update(ready)
+        return ready
+
+    def release(self, archive):
+        """Forgets an archive that left its inbox, or is to be taken again"""
+        self.taken.discard(archive)
+        self.completed.discard(archive)
+
+    def wait(self, timeout):
+        """Sleeps until an archive lands in an inbox or timeout passes"""
+        if self.inotify is None:
+            time.sleep(timeout)
+        elif select.select([self.inotify], [], [], timeout)[0]:
+            self.read_events()
+
+    def close(self):
+        if self.inotify is not None:
+            os.close(self.inotify)
+            self.inotify = None
+
+
+def ignore_signals():
+    """Initializer of the watch workers, which are stopped by the service
+    itself once their analyses are done"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def watch(inboxes, outbox, org_name=None, chassis_id=None, passwd=None, mapping=None, jobs=None,
+          max_pending=WATCH_MAX_PENDING, interval=WATCH_INTERVAL, once=False,
+          max_attempts=WATCH_MAX_ATTEMPTS, **options):
+    """Analyzes the RCLogs archives arriving in inboxes as a service, until
+    interrupted, or with once, until the inboxes are empty.
+
+    New archives are queued up to max_pending beyond the ones being analyzed,
+    past that they wait in their inbox. Up to jobs of them are analyzed at
+    once by analyze_archive on a process pool, the captures of a chassis
+    with state one after the other. Each gets its own workspace in outbox
+    with its outputs, analysis.log, metrics and a result.json, and is moved
+    there once analyzed so the inboxes only hold pending captures.
+
+    An archive whose worker died, which breaks the whole pool, is left in
+    its inbox to be taken again, and then analyzed on its own so it can't
+    take others down with it. After max_attempts such deaths it's moved
+    into a workspace under failed/ in outbox, with its result.json.
+    options are passed on to analyze(), with metrics always on.
+    """
+    outbox = os.path.abspath(outbox)
+    jobs = jobs or os.cpu_count() or 1
+    options = dict(options, metrics=True)
+    # A single pass takes whatever is in the inboxes, complete or not
+    watcher = InboxWatcher(inboxes, 0 if once else interval)
+    queue = collections.deque()
+    # {future: (job, group)}
+    running = {}
+    # {archive: times its worker died}
+    attempts = collections.Counter()
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=ignore_signals)
+
+    def restart():
+        """Replaces a broken pool once none of its futures are left"""
+        nonlocal executor
+        if not running:
+            executor.shutdown()
+            executor = ProcessPoolExecutor(max_workers=jobs, initializer=ignore_signals)
+
+    def finish(future):
+        job, group = running.pop(future)
+        archive, workspace = job[0], job[4]
+        try:
+            result = future.result()
+        except BrokenProcessPool as error:
+            attempts[archive] += 1
+            dirRemover(workspace, ignore_errors=True)
+            if attempts[archive] < max_attempts:
+                print(f"{os.path.basename(archive)}: worker died ({error}), left in the inbox")
+                watcher.release(archive)
+                restart()
+                return
+            del attempts[archive]
+            workspace = outbox_workspace(os.path.join(outbox, 'failed'), archive)
+            result = {'archive': archive, 'report': None, 'outputs': [], 'seconds': 0.0,
+                      'error': f'BrokenProcessPool: worker died {max_attempts} times ({error})'}
+            restart()
+        destination = os.path.join(workspace, os.path.basename(archive))
+        try:
+            shutil.move(archive, destination)
+            result['archive'] = destination
+        except FileNotFoundError:
+            # Taken out of the inbox during the analysis
+            pass
+        watcher.release(archive)
+        with open(os.path.join(workspace, 'result.json'), 'w') as f_obj:
+            json.dump(result, f_obj, indent=2)
+        status = result['error'] or result['report'] or 'no output'
+        print(f"{result['seconds']:8.2f}s  {os.path.basename(archive)}: {status}")
+
+    try:
+        while True:
+            arrived = watcher.ready(max_pending - len(queue))
+            for archive in arrived:
+                queue.append(archive_job(archive, outbox, org_name, chassis_id, passwd, mapping))
+
+            busy = {group for _, group in running.values()}
+            # An archive whose worker died before runs alone
+            isolated = any(attempts[job[0]] for job, _ in running.values())
+            for job in list(queue):
+                if isolated or len(running) >= jobs:
+                    break
+                group = job_group(job, options)
+                if group in busy or (attempts[job[0]] and running):
+                    continue
+                try:
+                    future = executor.submit(analyze_archive, *job, **options)
+                except BrokenProcessPool:
+                    # Broken by a worker whose futures aren't finished yet
+                    restart()
+                    break
+                queue.remove(job)
+                busy.add(group)
+                running[future] = (job, group)
+                isolated = bool(attempts[job[0]])
+
+            if once and not arrived and not queue and not running:
+                return
+            if running:
+                done, _ = wait_futures(running, timeout=interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            elif not arrived:
+                watcher.wait(interval)
+    except KeyboardInterrupt:
+        print(f"Stopping, waiting for {len(running)} running analyses...")
+        for future in list(running):
+            wait_futures([future])
+            finish(future)
+    finally:
+        executor.shutdown()
+        watcher.close()
+
+
+def interactive(**options):
+    main = LogAnalyzer()
+    # Scratch files are kept in the run's tmpfiles- directory unless removed
+    main.workspace.keep_scratch = not get_rm_junk()
+    getpd = pdlist()
+
+    with main.workspace:
+        analyze(main, getpd, **options)
+        print("Dealing with extra created files...")
+
+    print("Done")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Analyzes RCLogs archives into Excel reports. Without any '
+                    'archives it asks for everything and analyzes the one in the cwd.')
+    parser.add_argument('paths', nargs='*', help='RCLogs archives or directories containing them')
+    parser.add_argument('--org', help='organization name')
+    parser.add_argument('--id', help='chassis ID number')
+    parser.add_argument('--password', default=os.environ.get('RCLOGS_PASSWORD'),
+                        help='archive password, defaults to $RCLOGS_PASSWORD')
+    parser.add_argument('--categories', metavar='FILE',
+                        help='search categories, one per line with # comments (default: '
+                             'categories.txt next to the script if there is one, else the built-in '
+                             'ones, see categories.example.txt)')
+    parser.add_argument('--passwords', default=PASSWORDS_FILE, metavar='FILE',
+                        help='CSV with org and password columns of candidate passwords tried when '
+                             "an archive's password doesn't fit, '*' for any org")
+    parser.add_argument('--mapping', help='CSV with archive, org, id and password columns')
+    parser.add_argument('-o', '--output', default='.', help='directory for the per-archive workspaces')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes')
+    parser.add_argument('--no-pdlist', action='store_true', help="don't check pdlist for error counts")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the result cache')
+    parser.add_argument('--cache-size', type=int, default=CACHE_MAX_MB,
+                        help='result cache size limit in MB')
+    parser.add_argument('--no-cache', action='store_true', help="don't use the result cache")
+    parser.add_argument('--incremental', action='store_true',
+                        help='only analyze events newer than the last run of the chassis '
+                             'and report all of its events so far')
+    parser.add_argument('--state-dir', default=STATE_DIR, help='directory of the per-chassis state')
+    parser.add_argument('--db', help='SQLite database to add the events and disks to')
+    parser.add_argument('--no-excel', action='store_true', help="don't write the Excel reports")
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=list(OUTPUTS),
+                        help='output to write for each archive, can be repeated (default: excel)')
+    parser.add_argument('--trends', action='store_true',
+                        help='aggregate per category rates, bursts and reboot epochs into a '
+                             'Trends sheet and JSON (needs NumPy)')
+    parser.add_argument('--summary', action='store_true',
+                        help='only print the event count and latest events of each category, '
+                             'the quickest check of a controller')
+    parser.add_argument('--metrics', action='store_true',
+                        help='write per stage timing and memory as JSON next to each report')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also trace Python allocations per stage for --metrics (slower)')
+    parser.add_argument('--metrics-hook', action='append', default=[], metavar='MODULE:FUNCTION',
+                        help='function called with the metrics of each run, e.g. to push them '
+                             'into a metrics pipeline')
+    parser.add_argument('--watch', action='store_true',
+                        help='run as a service: paths are inbox directories whose arriving archives '
+                             'are analyzed into the -o outbox, until interrupted')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL,
+                        help='seconds between scans of the inboxes of --watch')
+    parser.add_argument('--max-pending', type=int, default=WATCH_MAX_PENDING,
+                        help='archives --watch queues beyond the running ones')
+    parser.add_argument('--max-attempts', type=int, default=WATCH_MAX_ATTEMPTS,
+                        help='times --watch runs an archive whose worker dies before moving it '
+                             'to failed/ in the outbox')
+    parser.add_argument('--once', action='store_true',
+                        help='with --watch, stop once the inboxes are empty')
+    parser.add_argument('--extract', action='store_true',
+                        help='extract the event logs and pdlist into a tmpfiles- directory of the '
+                             'workspace and read them from there, instead of from memory')
+    parser.add_argument('--memory-limit', type=int, metavar='MB',
+                        help='stream the logs and spill the events to temporary files to stay '
+                             'around this much memory, for logs larger than RAM (no result cache)')
+    args = parser.parse_args(argv)
+    if args.categories:
+        if not os.path.isfile(args.categories):
+            parser.error(f'--categories: no such file {args.categories}')
+        try:
+            load_categories(args.categories)
+        except ValueError as error:
+            parser.error(f'--categories: {error}')
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit else None
+    formats = args.formats or ([] if args.summary else ['excel'])
+    if args.summary and 'summary' not in formats:
+        formats.append('summary')
+    if args.trends and 'trends' not in formats:
+        formats.append('trends')
+    if args.no_excel:
+        formats = [name for name in formats if name != 'excel']
+
+    options = {
+        'cache': None if args.no_cache or memory_limit else ResultCache(args.cache_dir, args.cache_size * 1024 * 1024),
+        'state': ChassisState(args.state_dir) if args.incremental else None,
+        'database': os.path.abspath(args.db) if args.db else None,
+        'outputs': formats,
+        'metrics': args.metrics or bool(args.metrics_hook),
+        'trace_memory': args.trace_memory,
+        'metrics_hooks': [load_hook(spec) for spec in args.metrics_hook],
+        'memory_limit': memory_limit,
+        'passwords_file': args.passwords,
+        'categories_file': os.path.abspath(args.categories) if args.categories else None,
+        'extract': args.extract,
+    }
+
+    if args.watch and not args.paths:
+        parser.error('--watch needs the inbox directories to watch')
+    if not args.paths:
+        interactive(**options)
+        return 0
+
+    mapping = read_mapping(args.mapping) if args.mapping else None
+    # Batch and watch runs can't prompt, the org and ID have to be known
+    if args.watch and not mapping and (args.org is None or args.id is None):
+        parser.error('--watch needs --org and --id, or a --mapping')
+    for archive in [] if args.watch else find_archives(args.paths):
+        entry = mapping_entry(mapping, archive)
+        if not (entry.get('org') or args.org) or not (entry.get('id') or args.id):
+            parser.error(f'no --org and --id, or --mapping row, for {archive}')
+    if args.watch:
+        # Stop like on Ctrl-C, letting the running analyses finish
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        watch(args.paths, args.output, args.org, args.id, args.password, mapping, args.jobs,
+              args.max_pending, args.interval, args.once, args.max_attempts,
+              check_pdlist=not args.no_pdlist, **options)
+        return 0
+    results = batch_analyze(args.paths, args.output, args.org, args.id, args.password,
+                            mapping, args.jobs, check_pdlist=not args.no_pdlist, **options)
+    for result in results:
+        status = result['error'] or result['report'] or 'no output'
+        print(f"{result['seconds']:8.2f}s  {os.path.basename(result['archive'])}: {status}")
+        # Workers print into analysis.log, the summaries are shown here
+        for path in result['outputs']:
+            if path.endswith('-summary.txt'):
+                with open(path) as f_obj:
+                    print(f_obj.read(), end='')
+    failed = sum(1 for result in results if result['error'])
+    print(f"{len(results) - failed} analyzed, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""Synthetic RCLogs generator and per-stage benchmark of RCLogAnalyzer.
+
+Generates deterministic, password protected, nested RCLogs archives with a
+given number of incremental log events and pdlist drives, then times every
+analysis stage on them and records the throughput and peak memory:
+
+    python benchmark.py --events 10000 1000000 --drives 8 1000 -o results.json
+    python benchmark.py --events 10000 --compare results.json
+
+Generated archives are kept in --workdir and reused by later runs. Each
+config is benchmarked in a fresh process, so its peak memory is its own.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import struct
+import zlib
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZipFile, ZIP_DEFLATED
+from contextlib import redirect_stdout
+
+from RCLogAnalyzer import LogAnalyzer, Workspace, SEARCH_CATEGORIES, peak_rss_mb
+
+
+PASSWORD = 'benchmark'
+
+# Messages that match none of the search categories
+OTHER_DESCRIPTIONS = (
+    'Patrol Read complete',
+    'Patrol Read started',
+    'Host driver is loaded and operational',
+    'Time established as {time}; (4 seconds since power on)',
+    'Controller temperature normal',
+    'Enclosure PD {enc:02x}(c None/p1) communication restored',
+    'PD {dev:02x}(e0x{enc:02x}/s{slot}) is not a certified drive',
+    'Diagnostics passed for Flash',
+)
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xEDB88320 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+class ZipCrypto():
+    """Traditional PKWARE encryption, which zipfile can read but not write"""
+    table = crc_table()
+
+    def __init__(self, password):
+        self.key0, self.key1, self.key2 = 305419896, 591751049, 878082192
+        for byte in password:
+            self.update_keys(byte)
+
+    def update_keys(self, byte):
+        table = self.table
+        self.key0 = (self.key0 >> 8) ^ table[(self.key0 ^ byte) & 0xFF]
+        self.key1 = ((self.key1 + (self.key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+        self.key2 = (self.key2 >> 8) ^ table[(self.key2 ^ (self.key1 >> 24)) & 0xFF]
+
+    def encrypt(self, data):
+        # update_keys inlined, this loop runs once per archive byte
+        table = self.table
+        key0, key1, key2 = self.key0, self.key1, self.key2
+        out = bytearray(len(data))
+        for i, byte in enumerate(data):
+            temp = key2 | 2
+            out[i] = byte ^ (((temp * (temp ^ 1)) >> 8) & 0xFF)
+            key0 = (key0 >> 8) ^ table[(key0 ^ byte) & 0xFF]
+            key1 = ((key1 + (key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+            key2 = (key2 >> 8) ^ table[(key2 ^ (key1 >> 24)) & 0xFF]
+        self.key0, self.key1, self.key2 = key0, key1, key2
+        return bytes(out)
+
+
+def write_encrypted_zip(path, member_name, source, password, seed=0):
+    """Writes the source file as the only, stored and ZipCrypto encrypted,
+    member of a zip at path"""
+    crc, size = 0, os.path.getsize(source)
+    with open(source, 'rb') as f_obj:
+        while chunk := f_obj.read(1024 * 1024):
+            crc = zlib.crc32(chunk, crc)
+    name = member_name.encode()
+    # Encrypted size includes the 12 byte encryption header
+    fields = (20, 1, 0, 0, 0x21, crc, size + 12, size, len(name), 0)
+    local_header = struct.pack('<4sHHHHHIIIHH', b'PK\x03\x04', *fields) + name
+    central_header = struct.pack('<4sHHHHHHIIIHHHHHII', b'PK\x01\x02', 20, *fields,
+                                 0, 0, 0, 0, 0) + name
+
+    crypto = ZipCrypto(password.encode())
+    encryption_header = random.Random(seed).randbytes(11) + bytes([crc >> 24])
+    with open(path, 'wb') as out, open(source, 'rb') as f_obj:
+        out.write(local_header)
+        out.write(crypto.encrypt(encryption_header))
+        while chunk := f_obj.read(1024 * 1024):
+            out.write(crypto.encrypt(chunk))
+        central_offset = out.tell()
+        out.write(central_header)
+        out.write(struct.pack('<4sHHHHIIH', b'PK\x05\x06', 0, 0, 1, 1,
+                              len(central_header), central_offset, 0))
+
+
+def parse_mix(mix):
+    """'Battery=0.05,Fatal firmware error=0.001' -> {category: share}, the
+    share of events left goes to messages of no category"""
+    shares = {}
+    for item in filter(None, mix.split(',')):
+        category, _, share = item.rpartition('=')
+        shares[category.strip()] = float(share)
+    return shares
+
+
+def write_incremental_log(f_obj, events, mix, seed=0):
+    rng = random.Random(seed)
+    categories = list(mix)
+    cum_weights = []
+    total = 0.0
+    for category in categories:
+        total += mix[category]
+        cum_weights.append(total)
+    categories.append(None)
+    cum_weights.append(max(total, 1.0))
+
+    epoch_start = 1_600_000_000
+    clock = epoch_start
+    for seq_num in range(events):
+        category = rng.choices(categories, cum_weights=cum_weights)[0]
+        enc, slot = 0x20, rng.randrange(24)
+        dev = slot + 8
+        clock += rng.randrange(1, 120)
+        moment = time.gmtime(clock)
+        stamp = (f'{DAYS[moment.tm_wday]} {MONTHS[moment.tm_mon - 1]} {moment.tm_mday:2d} '
+                 f'{moment.tm_hour:02d}:{moment.tm_min:02d}:{moment.tm_sec:02d} {moment.tm_year}')
+        if category is None:
+            description = rng.choice(OTHER_DESCRIPTIONS).format(time=stamp, enc=enc, dev=dev, slot=slot)
+        else:
+            description = f'{category} on PD {dev:02x}(e0x{enc:02x}/s{slot}) Path 5000c500{dev:08x}'
+        # A few events are logged before the RTC is set
+        if rng.random() < 0.05:
+            when = f'Seconds since last reboot: {clock - epoch_start}'
+        else:
+            when = f'Time: {stamp}'
+        f_obj.write(
+            f'\nseqNum: 0x{seq_num:08x}\n{when}\n\n'
+            f'Code: 0x{rng.randrange(0x200):08x}\nClass: {rng.randrange(-1, 3)}\nLocale: 0x02\n'
+            f'Event Description: {description}\n'
+            f'Event Data:\n===========\nDevice ID: {dev}\nEnclosure Index: {enc}\nSlot Number: {slot}\n')
+
+
+def write_pdlist(f_obj, drives, seed=0):
+    rng = random.Random(seed)
+    for drive in range(drives):
+        enc, slot = 0x20 + drive // 24, drive % 24
+        f_obj.write(
+            f'Enclosure Device ID: {enc}\nSlot Number: {slot}\n'
+            f"Drive's position: DiskGroup: 0, Span: 0, Arm: {slot}\n"
+            f'Enclosure position: 1\nDevice Id: {drive + 8}\nWWN: 5000C500{drive:08X}\n'
+            f'Sequence Number: 2\nMedia Error Count: {rng.choice((0, 0, 0, rng.randrange(50)))}\n'
+            f'Other Error Count: {rng.choice((0, 0, rng.randrange(10)))}\n'
+            f'Predictive Failure Count: {rng.choice((0, 0, 0, 0, 1))}\n'
+            f'Last Predictive Failure Event Seq Number: 0\nPD Type: SAS\n\n'
+            f'Raw Size: 558.911 GB [0x45dd2fb0 Sectors]\n'
+            f'Non Coerced Size: 558.411 GB [0x45cd2fb0 Sectors]\n'
+            f'Coerced Size: 558.375 GB [0x45cc0000 Sectors]\n'
+            f'Firmware state: {rng.choice(("Online, Spun Up", "Online, Spun Up", "Failed"))}\n'
+            f'Device Firmware Level: LS0A\n'
+            f'Inquiry Data: SEAGATE ST600MM0006     LS0AS0M0H{drive:04d}\n'
+            f'Drive has flagged a S.M.A.R.T alert : {rng.choice(("No", "No", "No", "Yes"))}\n\n\n')
+
+
+def generate_rclogs(path, events, drives, mix, password=PASSWORD, seed=0):
+    """Writes a password protected RCLogs archive holding an inner zip with
+    an incremental log of events messages, an AllEvents log, a firmware
+    term log and a pdlist of drives"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inner = os.path.join(tmp_dir, 'RCLogs_inner.zip')
+        with ZipFile(inner, 'w', ZIP_DEFLATED) as zip_file:
+            for name, writer in (
+                    ('MegaRAID_Incremental_Log_c0.megalog',
+                     lambda f_obj: write_incremental_log(f_obj, events, mix, seed)),
+                    ('MegaRAID_AllEvents_c0.megalog',
+                     lambda f_obj: write_incremental_log(f_obj, events // 10, mix, seed + 1)),
+                    ('Get_FwTermLog_Controller_c0.megalog',
+                     lambda f_obj: f_obj.write('FW term log\n' * 1000)),
+                    ('pdlist_c0.txt', lambda f_obj: write_pdlist(f_obj, drives, seed))):
+                with zip_file.open(name, 'w', force_zip64=True) as member:
+                    with io.TextIOWrapper(member, write_through=True) as f_obj:
+                        writer(f_obj)
+        write_encrypted_zip(path, 'RCLogs_inner.zip', inner, password, seed)
+
+
+def time_stage(stages, name, function, trace_memory=False):
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    stages[name] = {'seconds': round(seconds, 4), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+    if trace_memory:
+        stages[name]['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+
+
+def benchmark(archive, trace_memory=False, password=PASSWORD):
+    """Runs each analysis stage on archive and returns {stage: measurements}"""
+    analyzer = LogAnalyzer(password, 'benchmark', 0, rc_file=archive)
+    analyzer.write_alilog = False
+    analyzer.categories_file = None
+    stages = {}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        # The stages' own progress output would drown the results
+        with tempfile.TemporaryDirectory() as workspace, redirect_stdout(io.StringIO()):
+            analyzer.workspace = Workspace(workspace)
+            time_stage(stages, 'extractor', lambda: analyzer.extractor(in_memory=True), trace_memory)
+            log_bytes = analyzer.inner_zip.getinfo(analyzer.members['incremental']).file_size
+
+            # The records are assembled lazily, materialize them to time the assembly
+            def convert_to_alilog():
+                analyzer.convert_to_alilog()
+                analyzer.events = list(analyzer.events)
+            time_stage(stages, 'convert_to_alilog', convert_to_alilog, trace_memory)
+            events = len(analyzer.events)
+            stages['convert_to_alilog']['events'] = events
+
+            time_stage(stages, 'oraganizer', analyzer.oraganizer, trace_memory)
+            stages['oraganizer']['rows'] = sum(len(lines) for lines in analyzer.search_dict.values())
+            time_stage(stages, 'disk_checker', analyzer.disk_checker, trace_memory)
+            stages['disk_checker']['disks'] = len(analyzer.disks)
+            analyzer.close()
+            # Writes the category sheets and Disk_Error_Count, which replaced
+            # excel_modifier and the pd_temp.xlsx/copy_sheet path
+            time_stage(stages, 'excel_maker', analyzer.excel_maker, trace_memory)
+    finally:
+        analyzer.close()
+        if trace_memory:
+            tracemalloc.stop()
+
+    total = sum(stage['seconds'] for stage in stages.values())
+    return {
+        'stages': stages,
+        'total_seconds': round(total, 4),
+        'events': events,
+        'log_mb': round(log_bytes / 2 ** 20, 2),
+        'events_per_second': round(events / total) if total else None,
+        'mb_per_second': round(log_bytes / 2 ** 20 / total, 2) if total else None,
+    }
+
+
+# Growth below these is noise, on stages that take a few milliseconds or
+# a few MB: {measurement: (absolute slack, format)}
+COMPARED = {'seconds': (0.05, '{:.3f}s'), 'peak_rss_mb': (10.0, '{:.1f} MB RSS')}
+
+
+def compare(results, previous, threshold):
+    """Returns the (config, stage, measurement, before, after) whose time or
+    peak memory grew more than threshold"""
+    regressions = []
+    for config, result in results.items():
+        for stage, measured in result['stages'].items():
+            earlier = previous.get(config, {}).get('stages', {}).get(stage, {})
+            for key, (slack, _) in COMPARED.items():
+                before = earlier.get(key)
+                if before and measured[key] > max(before * threshold, before + slack):
+                    regressions.append((config, stage, key, before, measured[key]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks RCLogAnalyzer on synthetic RCLogs archives.')
+    parser.add_argument('--events', type=int, nargs='+', default=[10000],
+                        help='incremental log events of each generated archive')
+    parser.add_argument('--drives', type=int, nargs='+', default=[8], help='pdlist drives of each archive')
+    parser.add_argument('--mix', default=','.join(f'{category}=0.02' for category in SEARCH_CATEGORIES),
+                        help="category shares, e.g. 'Battery=0.05,medium error=0.01', the rest match none")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'rclogs-benchmark'),
+                        help='where generated archives are kept')
+    parser.add_argument('--memory', action='store_true',
+                        help='also trace Python allocations per stage (slows the stages down)')
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='earlier results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown or peak memory growth ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {}
+    for events in args.events:
+        for drives in args.drives:
+            config = f'events={events},drives={drives}'
+            mix_tag = zlib.crc32(repr(sorted(mix.items())).encode())
+            archive = os.path.join(args.workdir, f'RCLogs-{events}-{drives}-{args.seed}-{mix_tag:08x}.log')
+            if not os.path.exists(archive):
+                print(f'Generating {os.path.basename(archive)}...')
+                generate_rclogs(archive, events, drives, mix, seed=args.seed)
+            print(f'Benchmarking {config}...')
+            # ru_maxrss is a high-water mark for the whole process, a fresh
+            # one per config keeps the earlier configs out of its peaks
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results[config] = executor.submit(benchmark, archive, args.memory).result()
+            for stage, measured in results[config]['stages'].items():
+                print(f"\t{stage:<18}{measured['seconds']:>10.3f}s {measured['peak_rss_mb']:>9.1f} MB RSS")
+            print(f"\t{'total':<18}{results[config]['total_seconds']:>10.3f}s "
+                  f"{results[config]['events_per_second']} events/s")
+
+    if args.output:
+        with open(args.output, 'w') as f_obj:
+            json.dump(results, f_obj, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f_obj:
+            regressions = compare(results, json.load(f_obj), args.threshold)
+        for config, stage, key, before, after in regressions:
+            form = COMPARED[key][1]
+            print(f'REGRESSION {config} {stage}: {form.format(before)} -> {form.format(after)}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,380 @@
+import io
+import json
+import os
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+import RCLogAnalyzer as rc
+from benchmark import ZipCrypto
+
+
+def record(seq_num, description, data='Device ID: 11'):
+    """Raw incremental log message as the firmware writes it"""
+    return (f'\nseqNum: 0x{seq_num:08x}\nTime: Mon Jan  4 10:22:33 2021\n\nCode: 0x00000071\n'
+            f'Class: 0\nLocale: 0x02\nEvent Description: {description}\n'
+            f'Event Data:\n===========\n{data}\n')
+
+
+def naive_categories(categories, text):
+    """Every category mentioned in text, one substring test each"""
+    return {category for category in categories if category.lower() in text.lower()} or {'Other'}
+
+
+DESCRIPTIONS = (
+    'Power state change on PD 0b(e0x20/s11) from spun up to spun down',
+    'State change on PD 0c(e0x20/s12) from ONLINE(18) to FAILED(11)',
+    'Rebuild started on PD 0c(e0x20/s12)',
+    'Rebuild automatically started on PD 0c(e0x20/s12)',
+    'Unexpected sense: PD 0a(e0x20/s10), Sense: 3/11/00 medium ERROR',
+    'Consistency Check started on VD 00/0',
+    'Patrol Read complete',
+)
+
+
+def test_match_finds_overlapping_and_contained_categories():
+    classifier = rc.Classifier(rc.SEARCH_CATEGORIES)
+    assert classifier.match(DESCRIPTIONS[0]) == {'Power state change', 'State change on PD'}
+    assert classifier.match(DESCRIPTIONS[3]) == {'Rebuild automatically started'}
+    assert classifier.match(DESCRIPTIONS[4]) == {'Unexpected sense', 'medium error'}
+    assert classifier.match(DESCRIPTIONS[6]) == set()
+
+
+def test_classify_matches_substring_search_and_falls_back_to_other():
+    data = ''.join(record(seq_num, description) for seq_num, description in enumerate(DESCRIPTIONS))
+    classifier = rc.Classifier(rc.SEARCH_CATEGORIES)
+    terms = rc.scan_terms(classifier.categories)
+    for scanned in (None, terms):
+        events = list(rc.scan_event_log(data.encode(), terms=scanned))
+        results = classifier.classify(events)
+        assert classifier.event_count == len(DESCRIPTIONS)
+        for event in events:
+            expected = naive_categories(rc.SEARCH_CATEGORIES, event.text)
+            assert {category for category, found in results.items() if event in found} == expected
+        assert [event.description for event in results['Other']] == ['Patrol Read complete']
+
+
+def test_event_in_several_categories_is_one_object():
+    events = list(rc.scan_event_log(record(1, DESCRIPTIONS[0]).encode()))
+    results = rc.Classifier(rc.SEARCH_CATEGORIES).classify(events)
+    assert results['Power state change'][0] is results['State change on PD'][0]
+
+
+def test_merge_events_keeps_the_first_stream_of_a_repeated_seq_num():
+    incremental = [rc.Event(1, description='inc 1'), rc.Event(3, description='inc 3'),
+                   rc.Event(None, description='inc none')]
+    all_events = [rc.Event(2, description='all 2'), rc.Event(3, description='all 3'),
+                  rc.Event(4, description='all 4'), rc.Event(None, description='all none')]
+    merged = list(rc.merge_events([incremental, all_events]))
+    assert [event.description for event in merged] == [
+        'inc 1', 'all 2', 'inc 3', 'all 4', 'inc none', 'all none']
+
+
+def test_split_log_cuts_at_seq_num_lines_only():
+    data = ('preamble\n' + ''.join(record(seq_num, 'Patrol Read complete')
+                                   for seq_num in range(40))).encode()
+    for pieces in (1, 2, 3, 7, 40, 100):
+        chunks = rc.split_log(data, pieces)
+        assert b''.join(chunks) == data
+        assert 1 <= len(chunks) <= pieces
+        assert chunks[0].startswith(b'preamble')
+        assert all(chunk.startswith(b'seqNum') for chunk in chunks[1:])
+        events = [event for chunk in chunks for event in rc.parse_event_log(chunk)]
+        assert [event.seq_num for event in events] == list(range(40))
+
+
+def test_cache_entries_are_plain_tuples(tmp_path):
+    events = list(rc.scan_event_log(''.join(record(seq_num, description) for seq_num, description
+                                             in enumerate(DESCRIPTIONS)).encode()))
+    search_dict = rc.Classifier(rc.SEARCH_CATEGORIES).classify(events)
+    disk = rc.Disk(['Enclosure Device ID: 32\n', 'Slot Number: 3\n', 'Media Error Count: 2\n'])
+    cache = rc.ResultCache(tmp_path)
+    cache.store('key', {'search_dict': search_dict, 'disks': [disk]})
+
+    # Nothing but builtins, so a __main__ run and an import read the same entry
+    with open(cache.entry_path('key'), 'rb') as f_obj:
+        assert b'RCLogAnalyzer' not in f_obj.read()
+    cached = cache.load('key')
+
+    def fields(search_dict):
+        return {category: [event.fields() for event in found] for category, found in search_dict.items()}
+    assert fields(cached['search_dict']) == fields(search_dict)
+    assert cached['search_dict']['Power state change'][0] is cached['search_dict']['State change on PD'][0]
+    assert cached['disks'][0].pd_parameters == disk.pd_parameters
+
+
+def test_chassis_state_round_trips_and_keeps_unreadable_files(tmp_path):
+    state = rc.ChassisState(tmp_path)
+    chassis = state.load('Acme', 7, rc.SEARCH_CATEGORIES)
+    assert chassis['watermark'] is None
+    events = list(rc.scan_event_log(''.join(record(seq_num, description) for seq_num, description
+                                             in enumerate(DESCRIPTIONS, 100)).encode()))
+    state.update(chassis, rc.Classifier(rc.SEARCH_CATEGORIES).classify(events))
+    state.save('Acme', 7, chassis)
+    loaded = state.load('acme', 7, rc.SEARCH_CATEGORIES)
+    assert loaded['watermark'] == 100 + len(DESCRIPTIONS) - 1
+    assert [event.fields() for event in loaded['search_dict']['Other']] == \
+        [event.fields() for event in chassis['search_dict']['Other']]
+
+    path = state.state_path('Acme', 7)
+    with open(path, 'wb') as f_obj:
+        f_obj.write(b'not a pickle')
+    assert state.load('Acme', 7, rc.SEARCH_CATEGORIES)['watermark'] is None
+    assert not tmp_path.joinpath(path).exists()
+    assert [file.name for file in tmp_path.iterdir()][0].startswith('acme-ID7.pickle.unreadable-')
+
+
+def test_event_database_stores_events_once_with_their_categories(tmp_path):
+    events = list(rc.scan_event_log(''.join(record(seq_num, description) for seq_num, description
+                                             in enumerate(DESCRIPTIONS)).encode()))
+    events.append(rc.Event(None, description='Power state change without a seqNum'))
+    search_dict = rc.Classifier(rc.SEARCH_CATEGORIES).classify(events)
+    path = str(tmp_path / 'events.db')
+    for org in ('Acme', ' acme'):
+        with rc.EventDatabase(path) as event_db:
+            event_db.add_events(org, '7', search_dict)
+    with rc.EventDatabase(path) as event_db:
+        assert event_db.connection.execute('SELECT COUNT(*) FROM events').fetchone() == (len(DESCRIPTIONS),)
+        assert event_db.connection.execute('SELECT DISTINCT org FROM events').fetchall() == [('acme',)]
+        tags = event_db.connection.execute(
+            'SELECT e.seq_num, c.category FROM events e JOIN event_categories c ON c.event_id = e.id '
+            "WHERE e.seq_num = 0 ORDER BY c.category").fetchall()
+    assert tags == [(0, 'Power state change'), (0, 'State change on PD')]
+
+
+def encrypted_zip(path, name, data, password, deflate=False, descriptor=False):
+    """Writes data as the only ZipCrypto member of a zip at path, its sizes
+    and CRC in a trailing data descriptor with descriptor"""
+    name = name.encode()
+    crc = zlib.crc32(data)
+    payload = data
+    if deflate:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+    raw_time, raw_date, flags = 0x5A3C, 0x4F21, 0x9 if descriptor else 0x1
+    check = raw_time >> 8 if descriptor else crc >> 24
+    body = ZipCrypto(password.encode()).encrypt(bytes(range(11)) + bytes([check]) + payload)
+    method = 8 if deflate else 0
+    sizes = (crc, len(body), len(data))
+    local = struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, flags, method, raw_time, raw_date,
+                        *((0, 0, 0) if descriptor else sizes), len(name), 0) + name
+    trailer = struct.pack('<4s3L', b'PK\x07\x08', *sizes) if descriptor else b''
+    central = struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20, flags, method, raw_time, raw_date,
+                          *sizes, len(name), 0, 0, 0, 0, 0, 0) + name
+    end = struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, 1, 1, len(central),
+                      len(local) + len(body) + len(trailer), 0)
+    with open(path, 'wb') as f_obj:
+        f_obj.write(local + body + trailer + central + end)
+
+
+# Starts like the inner zip of an RCLogs archive, compresses like a log
+MEMBER_DATA = b'PK\x03\x04' + ''.join(record(seq_num, DESCRIPTIONS[seq_num % len(DESCRIPTIONS)])
+                                      for seq_num in range(300)).encode()
+
+
+@pytest.mark.parametrize('deflate', (False, True))
+@pytest.mark.parametrize('descriptor', (False, True))
+def test_encrypted_member_decrypts_like_zipfile(tmp_path, monkeypatch, deflate, descriptor):
+    # Small chunks, so the member is decrypted and inflated in many of them
+    monkeypatch.setattr(rc, 'DECRYPT_CHUNK_BYTES', 1000)
+    path = str(tmp_path / 'RCLogs.log')
+    encrypted_zip(path, 'inner.zip', MEMBER_DATA, 'secret', deflate, descriptor)
+    with zipfile.ZipFile(path) as zip_file:
+        info = zip_file.infolist()[0]
+        expected = zip_file.read(info, pwd=b'secret')
+    assert expected == MEMBER_DATA
+    password, stream = rc.open_encrypted(path, info, ['wrong', 'secret'])
+    with stream:
+        assert password == 'secret'
+        assert stream.read() == expected
+
+
+def test_wrong_passwords_are_rejected_even_past_the_check_byte(tmp_path):
+    path = str(tmp_path / 'RCLogs.log')
+    encrypted_zip(path, 'inner.zip', MEMBER_DATA, 'secret', deflate=True)
+    info = zipfile.ZipFile(path).infolist()[0]
+    # About one in 256 wrong passwords decrypts the header to the check byte
+    for number in range(100000):
+        lucky = f'wrong{number}'
+        with rc.EncryptedMember(path, info, lucky.encode()) as member:
+            if member.header[11] == rc.check_byte(info):
+                break
+    assert not rc.password_matches(path, info, lucky.encode())
+    with pytest.raises(RuntimeError, match='Bad password'):
+        rc.open_encrypted(path, info, ['wrong', lucky])
+    with pytest.raises(ValueError, match='No password'):
+        rc.open_encrypted(path, info, [])
+
+
+def test_candidate_passwords_fall_back_to_the_passwords_file(tmp_path):
+    passwords_file = tmp_path / 'passwords.csv'
+    passwords_file.write_text('org,password\nother,nope\n*,secret\nACME,acme-pass\n')
+    analyzer = rc.LogAnalyzer('given', 'Acme', 7, rc_file=str(tmp_path / 'RCLogs.log'),
+                              workspace=rc.Workspace(tmp_path))
+    analyzer.passwords_file = str(passwords_file)
+    assert analyzer.candidate_passwords() == ['given', 'acme-pass', 'secret']
+
+    path = str(tmp_path / 'RCLogs.log')
+    encrypted_zip(path, 'inner.zip', MEMBER_DATA, 'secret')
+    info = zipfile.ZipFile(path).infolist()[0]
+    password, stream = rc.open_encrypted(path, info, analyzer.candidate_passwords())
+    with stream:
+        assert (password, stream.read()) == ('secret', MEMBER_DATA)
+
+
+def test_unencrypted_member_needs_no_password(tmp_path):
+    path = str(tmp_path / 'RCLogs.log')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('inner.zip', MEMBER_DATA)
+    info = zipfile.ZipFile(path).infolist()[0]
+    password, stream = rc.open_encrypted(path, info, [])
+    with stream:
+        assert (password, stream.read()) == (None, MEMBER_DATA)
+
+
+def test_load_categories_reads_the_example_and_rejects_an_empty_table(tmp_path):
+    example = os.path.join(os.path.dirname(os.path.abspath(rc.__file__)), 'categories.example.txt')
+    assert rc.load_categories(example) == rc.SEARCH_CATEGORIES
+    assert rc.load_categories(str(tmp_path / 'missing.txt')) == rc.SEARCH_CATEGORIES
+    empty = tmp_path / 'categories.txt'
+    empty.write_text('# ECC\n\n')
+    with pytest.raises(ValueError, match='No categories'):
+        rc.load_categories(str(empty))
+
+
+def test_archives_of_the_same_name_get_their_own_workspace_and_mapping(tmp_path):
+    mapping_file = tmp_path / 'mapping.csv'
+    mapping_file.write_text('archive,org,id,password\nd1/RCLogs.log,one,1,p1\nd2/RCLogs.log,two,2,p2\n')
+    mapping = rc.read_mapping(str(mapping_file))
+    assert 'RCLogs.log' not in mapping
+    first, second = (rc.archive_job(str(tmp_path / directory / 'RCLogs.log'), str(tmp_path / 'out'),
+                                    mapping=mapping) for directory in ('d1', 'd2'))
+    assert first[1:4] == ('one', '1', 'p1') and second[1:4] == ('two', '2', 'p2')
+    assert first[4] != second[4]
+    assert os.path.isdir(first[4]) and os.path.isdir(second[4])
+
+
+def test_chassis_state_reclassifies_its_events_when_the_categories_change(tmp_path):
+    state = rc.ChassisState(tmp_path)
+    chassis = state.load('Acme', 7, rc.SEARCH_CATEGORIES)
+    events = list(rc.scan_event_log(''.join(record(seq_num, description) for seq_num, description
+                                             in enumerate(DESCRIPTIONS, 100)).encode()))
+    state.update(chassis, rc.Classifier(rc.SEARCH_CATEGORIES).classify(events))
+    state.save('Acme', 7, chassis)
+
+    categories = rc.SEARCH_CATEGORIES + ('Patrol Read',)
+    loaded = state.load('Acme', 7, categories)
+    assert loaded['categories'] == categories
+    assert loaded['watermark'] == 100 + len(DESCRIPTIONS) - 1
+    assert [event.description for event in loaded['search_dict']['Patrol Read']] == ['Patrol Read complete']
+    assert loaded['search_dict']['Other'] == []
+    assert len(loaded['search_dict']['State change on PD']) == 2
+
+
+def test_incremental_scan_starts_past_the_watermark():
+    data = ('preamble\n' + ''.join(record(seq_num, DESCRIPTIONS[seq_num % len(DESCRIPTIONS)])
+                                   for seq_num in range(40))).encode()
+    assert rc.seq_num_line_after(data, 20) == data.index(b'seqNum: 0x00000015')
+    assert rc.seq_num_line_after(data, -1) == data.index(b'seqNum')
+    assert rc.seq_num_line_after(data, 39) == len(data)
+    terms = rc.scan_terms(rc.SEARCH_CATEGORIES)
+    assert [event.seq_num for event in rc.scan_event_log(data, 20, terms=terms)] == list(range(21, 40))
+
+
+def test_parallel_parser_splits_every_log_and_writes_the_alilog(tmp_path, monkeypatch):
+    monkeypatch.setattr(rc, 'PARSE_CHUNK_BYTES', 2000)
+    monkeypatch.setattr(rc.os, 'cpu_count', lambda: 3)
+    logs = {name: ''.join(record(seq_num, DESCRIPTIONS[seq_num % len(DESCRIPTIONS)])
+                          for seq_num in seq_nums).encode()
+            for name, seq_nums in (('incremental', range(50, 100)), ('all_events', range(0, 80)))}
+    analyzer = rc.LogAnalyzer('', 'Acme', 7, rc_file=str(tmp_path / 'RCLogs.log'),
+                              workspace=rc.Workspace(tmp_path))
+    analyzer.member_data = logs
+    alilog = str(tmp_path / 'GetEventsToAlilog')
+    terms = rc.scan_terms(rc.SEARCH_CATEGORIES)
+    streams = analyzer.parallel_parser([('incremental', alilog), ('all_events', None)], terms)
+    assert len(streams) == 6
+
+    expected = rc.merge_events([rc.parse_event_log(logs['incremental'], None, str(tmp_path / 'serial'), terms),
+                                rc.parse_event_log(logs['all_events'], None, None, terms)])
+    assert [event.fields() for event in rc.merge_events(streams)] == [event.fields() for event in expected]
+    with open(alilog) as parallel, open(tmp_path / 'serial') as serial:
+        assert parallel.read() == serial.read()
+
+
+PDLIST = ''.join(f'Enclosure Device ID: 32\nSlot Number: {slot}\nDevice Id: {slot + 10}\n'
+                 f'Media Error Count: {slot}\nOther Error Count: 0\nFirmware state: Online, Spun Up\n\n'
+                 for slot in range(3))
+
+
+def rclogs_archive(path, password='secret'):
+    """Writes an RCLogs archive: the inner zip of an incremental log, an
+    AllEvents log and pdlist, encrypted in an outer zip"""
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('MegaRAID_Incremental_Log_c0.megalog', ''.join(
+            record(seq_num, DESCRIPTIONS[seq_num % len(DESCRIPTIONS)]) for seq_num in range(20, 60)))
+        zip_file.writestr('MegaRAID_AllEvents_c0.megalog', ''.join(
+            record(seq_num, DESCRIPTIONS[seq_num % len(DESCRIPTIONS)]) for seq_num in range(0, 30)))
+        zip_file.writestr('pdlist_c0.txt', PDLIST)
+    encrypted_zip(path, 'RCLogs_inner.zip', inner.getvalue(), password, deflate=True)
+
+
+@pytest.mark.parametrize('extract', (False, True))
+def test_analyze_reads_the_same_events_from_memory_or_extracted_logs(tmp_path, extract):
+    archive = str(tmp_path / 'RCLogs.log')
+    rclogs_archive(archive)
+    with rc.Workspace(tmp_path / 'run') as workspace:
+        analyzer = rc.LogAnalyzer('secret', 'Acme', 7, rc_file=archive, workspace=workspace)
+        analyzer.write_alilog = False
+        analyzer.categories_file = None
+        rc.analyze(analyzer, outputs=(), extract=extract)
+        assert (workspace.scratch is not None) == extract
+    assert sorted({event.seq_num for events in analyzer.search_dict.values() for event in events}) == \
+        list(range(60))
+    assert [disk.pd_parameters['mediaError'] for disk in analyzer.disks] == [0, 1, 2]
+
+
+def test_watch_analyzes_an_inbox_into_the_outbox(tmp_path):
+    inbox, outbox = tmp_path / 'inbox', tmp_path / 'outbox'
+    inbox.mkdir()
+    rclogs_archive(str(inbox / 'RCLogs-good.log'))
+    (inbox / 'RCLogs-bad.log').write_bytes(b'not a zip at all')
+    rc.watch([str(inbox)], str(outbox), 'Acme', 7, 'secret', jobs=1, interval=0.1, once=True,
+             outputs=('jsonl',), check_pdlist=True)
+
+    assert list(inbox.iterdir()) == []
+    assert sorted(path.name for path in outbox.iterdir()) == ['RCLogs-bad', 'RCLogs-good']
+    with open(outbox / 'RCLogs-good' / 'result.json') as f_obj:
+        good = json.load(f_obj)
+    assert good['error'] is None
+    assert good['archive'] == str(outbox / 'RCLogs-good' / 'RCLogs-good.log')
+    assert [os.path.basename(path) for path in good['outputs']] == \
+        [f'Acme-ID7-RC_Log_Analyze-{rc.date.today():%B-%d-%Y}.jsonl']
+    assert os.path.isfile(good['outputs'][0])
+    assert any(path.name.endswith('-metrics.json') for path in (outbox / 'RCLogs-good').iterdir())
+    with open(outbox / 'RCLogs-bad' / 'result.json') as f_obj:
+        bad = json.load(f_obj)
+    assert bad['error'].startswith('BadZipFile')
+    assert (outbox / 'RCLogs-bad' / 'RCLogs-bad.log').is_file()
+
+
+def test_inbox_watcher_only_remembers_archives_it_may_take(tmp_path):
+    watcher = rc.InboxWatcher([str(tmp_path)], settle=3600)
+    try:
+        (tmp_path / 'notes.txt').write_text('not an archive')
+        (tmp_path / 'RCLogs-1.log').write_bytes(b'archive')
+        (tmp_path / 'RCLogs-2.log').write_bytes(b'archive')
+        ready = watcher.ready(1)
+        if watcher.inotify is None:
+            pytest.skip('no inotify, archives are only ready once settled')
+        assert ready == [str(tmp_path / 'RCLogs-1.log')]
+        assert watcher.completed == {str(tmp_path / 'RCLogs-2.log')}
+        (tmp_path / 'RCLogs-2.log').unlink()
+        watcher.release(ready[0])
+        assert watcher.ready(1) == []
+        assert watcher.completed == set()
+    finally:
+        watcher.close()